@@ -8,7 +8,9 @@ import sys
 from rpi.custom_logging import configure_logging
 from . import __VERSION__ as VERSION, ADMIN_EMAIL
 from .connections import Connections
+from .downloader import DownloaderMetrics
 from .managers.users_manager import UsersManager
+from .notification_queue import NotificationQueue
 
 configure_logging(called_from=__file__, use_logs_folder=True)
 
@@ -47,6 +49,17 @@ def main():
     email.add_argument('mensaje')
     email.add_argument('-archivo')
 
+    worker = subparser.add_parser('worker')
+    worker.add_argument('-lote', help='notificaciones por lote', type=int, default=50)
+    worker.add_argument('-intervalo', help='segundos de espera', type=float, default=10)
+    worker.add_argument('-una_vez', help='salir cuando la cola esté vacía', action='store_true')
+    worker.add_argument('-muertos', help='ver notificaciones fallidas', action='store_true')
+    worker.add_argument('-reencolar', help='reencolar notificaciones fallidas',
+                        action='store_true')
+
+    metricas = subparser.add_parser('metricas')
+    metricas.add_argument('-reset', help='borrar métricas', action='store_true')
+
     opt = vars(parser.parse_args())
 
     if 'version' in opt:
@@ -54,6 +67,25 @@ def main():
             print(f'rpi {VERSION}')
             return
 
+    if 'lote' in opt:
+        if opt['muertos'] is True:
+            for notification in NotificationQueue().dead_letters():
+                print(notification)
+        elif opt['reencolar'] is True:
+            print(f'{NotificationQueue().requeue_dead_letters()} notificaciones reencoladas')
+        else:
+            Connections.run_worker(opt['intervalo'], opt['lote'], opt['una_vez'])
+        return
+
+    if 'reset' in opt:
+        metrics = DownloaderMetrics()
+        if opt['reset'] is True:
+            metrics.reset()
+            print('Métricas borradas')
+        else:
+            print(metrics.format_summary() or 'No hay métricas')
+        return
+
     try:
         if opt['ver'] is False and opt['eliminar'] is None and opt['usernames'] is False:
             print(user_manager.usernames)
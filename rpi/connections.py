@@ -3,48 +3,78 @@ import logging
 import os
 import platform
 import re
-import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email import encoders
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from threading import Lock, Thread
+from threading import Lock
 
 import gspread
 from gspread import WorksheetNotFound
 from gspread.exceptions import SpreadsheetNotFound
 from oauth2client.service_account import ServiceAccountCredentials as Sac
 
-from rpi.managers.keys_manager import KeysManager
 from rpi.managers.services_manager import ServicesManager
 from rpi.managers.users_manager import UsersManager
 from .dns import RpiDns
 from .downloader import Downloader
-from .exceptions import NeccessaryArgumentError, UserNotFoundError, DownloaderError, \
+from .exceptions import NeccessaryArgumentError, UserNotFoundError, \
     SpreadsheetNotFoundError, SheetNotFoundError, InvalidMailAddressError
+from .launcher import TelegramLauncher, TelegramDispatcher
+from .notification_queue import NotificationQueue
+from .smtp_session import SmtpSession
 
 
 class Connections:
     """Manages every outgoing connection."""
     DISABLE = platform.system() == 'Windows'
 
+    # Maximum number of notifications sent at the same time by each type of launcher. The
+    # workers are shared by every call to notify in the process.
+    LAUNCHER_CONCURRENCY = {'TelegramLauncher': 4}
+    DEFAULT_CONCURRENCY = 8
+
+    # If True, notify stores the notifications in the NotificationQueue and returns without
+    # waiting for the network. They are delivered by the worker (rpi worker).
+    QUEUED = False
+
+    # Seconds during which the notifications of each service to the same user are coalesced
+    # in the NotificationQueue, so the reports of many scripts arrive in a single message. The
+    # notifications of these services are always queued, unless queued=False is passed.
+    DIGEST_SERVICES = {'LOG': 300}
+
+    _executors = {}
+    _executors_lock = Lock()
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.user_manager = UsersManager()
+        self.user_manager = UsersManager.shared()
+        self.downloader = Downloader.shared()
+
+    @staticmethod
+    def get_executor(launcher) -> ThreadPoolExecutor:
+        """Returns the executor that sends the notifications of a type of launcher.
 
-        self.errors_lock = Lock()
-        self.codes_lock = Lock()
-        self.errores = []
-        self.output_codes = []
-        self.downloader = Downloader()
+        Args:
+            launcher (BaseLauncher): launcher of the notification.
 
-    def append_code(self, code):
-        with self.codes_lock:
-            self.output_codes.append(code)
+        Returns:
+            ThreadPoolExecutor: executor shared by the process.
 
-    def append_error(self, something):
-        with self.errors_lock:
-            self.errores.append(something)
+        """
+        name = type(launcher).__name__
+
+        with Connections._executors_lock:
+            try:
+                return Connections._executors[name]
+            except KeyError:
+                workers = Connections.LAUNCHER_CONCURRENCY.get(
+                    name, Connections.DEFAULT_CONCURRENCY)
+                executor = ThreadPoolExecutor(workers, thread_name_prefix=name)
+                Connections._executors[name] = executor
+                return executor
 
     @staticmethod
     def force_notify(title, message, destinations=None):
@@ -55,10 +85,28 @@ class Connections:
         return output
 
     @staticmethod
-    def notify(title, message, destinations=None, file=None, force=False):
-        # TODO: INSERT DOCSTRING
-        # TODO: IMPROVE CODE
-        # TODO: TRANSLATE INTO ENGLISH
+    def notify(title, message, destinations=None, file=None, force=False, details=False,
+               queued=None):
+        """Sends a notification to some users, through their launchers.
+
+        Args:
+            title (str): title of the notification.
+            message (str): message of the notification.
+            destinations (Union[str, Iterable[str]]): username, usernames, 'multicast' (users
+                of the service of file) or 'broadcast' (every user).
+            file (str): file of the service sending the notification.
+            force (bool): if True, users not registered in the service are notified too.
+            details (bool): if True, the result of each user is returned (see dispatch).
+            queued (bool): if True, the notification is queued to be delivered by the worker.
+                If None, Connections.QUEUED is used, or True if the service is in
+                Connections.DIGEST_SERVICES.
+
+        Returns:
+            Union[bool, dict]: True if every notification was sent (or queued), or the results
+                by user if details is True. If the notification was queued, the results are
+                the ids of the queued notifications.
+
+        """
 
         self = object.__new__(Connections)
         self.__init__()
@@ -111,7 +159,7 @@ class Connections:
             if user.username not in self.user_manager.usernames:
                 raise UserNotFoundError(f'Uknown username: {user.username!r}')
 
-        threads = []
+        users = []
         for user in self.user_manager:
             if passports[user] is False:
                 continue
@@ -119,60 +167,280 @@ class Connections:
                 self.logger.warning(
                     'User %r is not registered in the service %r', user.username, service.name)
                 continue
+            users.append(user)
+
+        digest = Connections.DIGEST_SERVICES.get(service.name, 0)
+        if queued is None:
+            queued = Connections.QUEUED or bool(digest)
 
-            self.logger.debug('Starting connection thread of %s', user.username)
-            threads.append(
-                Thread(name=user.username, target=self._notify, args=(user, title, message),
-                       daemon=True))
-            threads[-1].start()
+        if queued is True:
+            ids = NotificationQueue().enqueue(
+                [user.username for user in users], title, message, digest)
+            if details is True:
+                return {user.username: id_ for user, id_ in zip(users, ids)}
+            return True
 
-        for thread in threads:
-            thread.join()
+        results = self.dispatch(users, title, message)
 
-        self.logger.debug('Connection threads finished')
+        if details is True:
+            return results
 
-        if len(self.errores):
+        if any(isinstance(result, Exception) for result in results.values()):
             report = {'title': title, 'message': message, 'destinations': destinations,
                       'file': file, 'force': force}
             self.logger.error('Notification errors: %s', report)
             return False
-        return all(self.output_codes)
+        return all(results.values())
+
+    def dispatch(self, users, title, message) -> dict:
+        """Sends a notification to some users, at the same time.
+
+        The Telegram messages are sent together through TelegramDispatcher.send_many, which
+        interleaves the chats within the rate limits of Telegram, unless the digest mode of
+        TelegramLauncher is enabled.
+
+        Args:
+            users (Iterable[User]): users to notify.
+            title (str): title of the notification.
+            message (str): message of the notification.
+
+        Returns:
+            dict: username -> True if the notification was sent, False if it could not be sent
+                (banned user, notifications disabled or invalid launcher) or the exception
+                raised sending it (usually DownloaderError).
+
+        """
+        futures = {}
+        telegram_users = []
+        for user in users:
+            if isinstance(user.launcher, TelegramLauncher) and not user.launcher.DIGEST_WINDOW:
+                telegram_users.append(user)
+                continue
 
-    def _notify(self, user, title, message):
-        # TODO: INCLUDE DOCSTRING
-        # TODO: IMPROVE CODE
-        # TODO: TRANSLATE INTO ENGLISH
+            self.logger.debug('Queueing notification of %s', user.username)
+            futures[user.username] = Connections.get_executor(user.launcher).submit(
+                self._notify, user, title, message)
 
-        try:
-            if user.is_active is False:
-                self.logger.warning('BANNED USER: %r', user.username)
-                self.append_code(False)
-                return
+        telegram_results = {}
+        if telegram_users:
+            self.logger.debug('Queueing telegram notifications of %d users', len(telegram_users))
+            telegram_results = Connections.get_executor(telegram_users[0].launcher).submit(
+                self._notify_telegram, telegram_users, title, message).result()
 
-            if self.DISABLE is True:
-                self.logger.warning('DISABLED NOTIFICATIONS - %r', user.username)
-                self.append_code(False)
-                return
+        results = {}
+        for user in users:
+            try:
+                results[user.username] = telegram_results[user.username]
+            except KeyError:
+                results[user.username] = futures[user.username].result()
+
+        self.logger.debug('Notifications finished')
+        return results
+
+    @staticmethod
+    def deliver_queued(queue=None, batch_size=50) -> tuple:
+        """Delivers a batch of queued notifications.
+
+        The digest mode of the launchers is bypassed, so the failures are seen here. The
+        notifications coalesced in the queue are joined by the launcher of their user.
+        Notifications sent, or that can never be sent (banned user, invalid launcher, unknown
+        user), are removed from the queue. The ones that fail with any exception are retried
+        later, until they are moved to the dead letters.
+
+        Args:
+            queue (NotificationQueue): queue to drain. By default, the one of the system.
+            batch_size (int): maximum number of notifications delivered.
+
+        Returns:
+            tuple: number of notifications delivered, retried and moved to dead letters.
+
+        """
+        if queue is None:
+            queue = NotificationQueue()
+        self = object.__new__(Connections)
+        self.__init__()
+
+        futures = []
+        for notification in queue.claim(batch_size):
+            user = self.user_manager.by_username.get(notification.username)
+
+            if user is None:
+                self.logger.error('Dropped notification %d to unknown user %r',
+                                  notification.id, notification.username)
+                queue.ack(notification.id)
+                continue
+
+            title, message = user.launcher.join_messages(notification.messages)
+            futures.append((notification, Connections.get_executor(user.launcher).submit(
+                self._notify, user, title, message, False)))
+
+        delivered = retried = dead = 0
+        for notification, future in futures:
             try:
-                user.launcher.fire(title, message)
-            except NotImplementedError:
-                self.append_code(False)
+                result = future.result()
+            except Exception as exc:
+                result = exc
+
+            if isinstance(result, Exception):
+                if queue.retry(notification, result):
+                    retried += 1
+                else:
+                    dead += 1
+            else:
+                queue.ack(notification.id)
+                delivered += 1
+
+        return delivered, retried, dead
+
+    @staticmethod
+    def run_worker(interval=10, batch_size=50, once=False, queue=None):
+        """Delivers the queued notifications until it is interrupted.
+
+        Args:
+            interval (float): seconds to wait when there are no notifications ready.
+            batch_size (int): maximum number of notifications delivered at the same time.
+            once (bool): if True, returns when there are no notifications ready.
+            queue (NotificationQueue): queue to drain. By default, the one of the system.
+
+        """
+        logger = logging.getLogger(__name__)
+        if queue is None:
+            queue = NotificationQueue()
+
+        while True:
+            delivered, retried, dead = Connections.deliver_queued(queue, batch_size)
+
+            if delivered or retried or dead:
+                logger.info('Worker: %d delivered, %d retried, %d dead letters',
+                            delivered, retried, dead)
+                continue
+
+            if once is True:
                 return
-            self.logger.debug('Sent notification to %r', user.username)
-            self.append_code(True)
-            return
-        except DownloaderError:
-            self.logger.error('Error sending to %s', user.username)
-            self.append_error(user)
-            self.append_code(True)
+
+            time.sleep(interval)
+
+    def _can_notify(self, user) -> bool:
+        """Returns False if the user is banned or the notifications are disabled."""
+        if user.is_active is False:
+            self.logger.warning('BANNED USER: %r', user.username)
+            return False
+
+        if self.DISABLE is True:
+            self.logger.warning('DISABLED NOTIFICATIONS - %r', user.username)
+            return False
+
+        return True
+
+    def _notify(self, user, title, message, digest=True):
+        """Sends a notification to a user. See dispatch.
+
+        If digest is False, the digest mode of the launcher is bypassed, so the notification
+        is sent at once and its errors are returned.
+        """
+
+        if self._can_notify(user) is False:
+            return False
+
+        try:
+            user.launcher.fire(title, message, digest=digest)
+        except NotImplementedError:
+            return False
+        except Exception as exc:
+            # Any error of a launcher (DownloaderError, telegram errors, UserError...) only
+            # affects the notification of its user.
+            self.logger.error('Error sending to %s: %r', user.username, exc)
+            return exc
+
+        self.logger.debug('Sent notification to %r', user.username)
+        return True
+
+    def _notify_telegram(self, users, title, message) -> dict:
+        """Sends a notification to some users of TelegramLauncher in a single
+        TelegramDispatcher.send_many call. See dispatch."""
+        results = {}
+        pending = []
+        for user in users:
+            if self._can_notify(user) is False:
+                results[user.username] = False
+            else:
+                pending.append(user)
+
+        text = TelegramLauncher.join_title(title, message)
+        sent = TelegramDispatcher.shared().send_many(
+            (user.launcher.chat_id, text) for user in pending)
+
+        for user in pending:
+            # Users sharing a chat get the results of that chat in order.
+            result = sent[user.launcher.chat_id].pop(0)
+            if isinstance(result, Exception):
+                self.logger.error('Error sending to %s: %r', user.username, result)
+            else:
+                self.logger.debug('Sent notification to %r', user.username)
+            results[user.username] = result
+
+        return results
 
     @staticmethod
     def send_email(destinations, subject, message, files=None, is_file=False, origin='Rpi'):
-        # TODO: INCLUDE DOCSTRING
+        """Sends an email from the mail account of the system, reusing its SMTP session.
+
+        Args: see build_email.
+
+        Returns:
+            bool: True.
+
+        """
 
         logger = logging.getLogger(__name__)
         logger.debug('Sending mail %r to %r', subject, destinations)
 
+        msg = Connections.build_email(destinations, subject, message, files, is_file, origin)
+        SmtpSession.shared().send(msg)
+        return True
+
+    @staticmethod
+    def send_emails(batch) -> list:
+        """Sends many emails over a single SMTP session.
+
+        Args:
+            batch (Iterable[dict]): arguments of send_email of each email.
+
+        Raises:
+            InvalidMailAddressError: if any destination is not valid. In that case no email is
+                sent.
+
+        Returns:
+            list: True for each email sent, or the exception raised sending it.
+
+        """
+
+        logger = logging.getLogger(__name__)
+        messages = [Connections.build_email(**kwargs) for kwargs in batch]
+        logger.debug('Sending %d mails', len(messages))
+
+        return SmtpSession.shared().send_many(messages)
+
+    @staticmethod
+    def build_email(destinations, subject, message, files=None, is_file=False, origin='Rpi'):
+        """Builds an email from the mail account of the system.
+
+        Args:
+            destinations (Union[str, List[str]]): email addresses of the destinations.
+            subject (str): subject of the email.
+            message (str): body of the email, with html format.
+            files (Union[str, list, dict]): files to attach. If it is a dict, the keys are the
+                files and the values the names of the attachments.
+            is_file (bool): if True, files are the contents of the attachments instead of paths.
+            origin (str): name of the sender.
+
+        Returns:
+            MIMEMultipart: email.
+
+        """
+
+        logger = logging.getLogger(__name__)
+
         address_pattern = re.compile(r"(^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$)")
 
         if isinstance(destinations, (list, tuple)):
@@ -211,8 +479,7 @@ class Connections:
             else:
                 raise TypeError
 
-        password = KeysManager.get('mail_password')
-        username = KeysManager.get('mail_username')
+        username = SmtpSession.shared().username
 
         msg = MIMEMultipart()
         msg['From'] = f"{origin} <{username}>"
@@ -241,12 +508,8 @@ class Connections:
                 part.add_header('Content-Disposition', 'attachment', filename=realfilename)
 
                 msg.attach(part)
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login(username, password)
-        server.sendmail(username, msg['To'], msg.as_string())
-        server.quit()
-        return True
+
+        return msg
 
     @staticmethod
     def to_google_spreadsheets(filename, sheetname, data):
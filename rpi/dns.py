@@ -2,8 +2,12 @@
 
 """Domain Name System of the Raspberry Pi"""
 
+import atexit
+import os
 import platform
 import sqlite3
+import threading
+from collections import defaultdict
 from difflib import SequenceMatcher
 
 from rpi.exceptions import UnknownError, DnsError, PlatformError
@@ -11,6 +15,70 @@ from rpi.exceptions import UnknownError, DnsError, PlatformError
 
 # WARNING: THIS FILE DOES NOT USE LOG DUE TO IMPORT ERRORS.
 
+class FuzzyAliasIndex:
+    """Index of aliases to find the most similar one to a misspelled alias.
+
+    Aliases are grouped by length, so only the ones whose length allows a similarity over the
+    threshold are considered, and each candidate is checked against the cheap upper bound
+    of SequenceMatcher (quick_ratio) before computing the real ratio. Resolved aliases are
+    memorized.
+    """
+
+    def __init__(self, aliases, threshold=0.9):
+        self.threshold = threshold
+        self.by_length = defaultdict(list)
+        self.memo = {}
+
+        for position, alias in enumerate(aliases):
+            self.by_length[len(alias)].append((position, alias.lower(), alias))
+
+    def candidates(self, alias: str):
+        """Yields the aliases whose length is compatible with the threshold."""
+        length = len(alias)
+        minimum = int(length * self.threshold / (2 - self.threshold))
+        maximum = int(length * (2 - self.threshold) / self.threshold) + 1
+
+        for other_length in range(minimum, maximum + 1):
+            yield from self.by_length.get(other_length, ())
+
+    def search(self, alias: str) -> tuple:
+        """Returns the most similar alias and its ratio.
+
+        If no alias reaches the threshold, the alias returned is None and the ratio is the best
+        one found among the candidates.
+
+        """
+
+        alias = alias.lower()
+
+        try:
+            return self.memo[alias]
+        except KeyError:
+            pass
+
+        matcher = SequenceMatcher(None)
+        matcher.set_seq1(alias)
+        best = (None, 0.0, -1)
+
+        for position, normalized, original in self.candidates(alias):
+            matcher.set_seq2(normalized)
+
+            if matcher.quick_ratio() < max(self.threshold, best[1]):
+                continue
+
+            ratio = matcher.ratio()
+            if ratio > best[1] or (ratio == best[1] and position < best[2]):
+                best = (original, ratio, position)
+
+        if best[1] < self.threshold:
+            result = (None, best[1])
+        else:
+            result = best[:2]
+
+        self.memo[alias] = result
+        return result
+
+
 class RpiDns:
     """Dns for the entire system."""
     if platform.system() == 'Linux':
@@ -18,33 +86,133 @@ class RpiDns:
     else:
         PATH = 'D:/.database/rpi_dns.sqlite'
 
+    # Seconds to wait for other processes to release the database before raising
+    # 'database is locked'.
+    TIMEOUT = 30
+
+    PERSISTENT = False
+
+    _cache = None
+    _cache_stamp = None
+    _fuzzy_index = None
+    _cache_lock = threading.Lock()
+
+    _connection = None
+    _connection_path = None
+    _connection_lock = threading.RLock()
+
     def __init__(self):
-        self.con = sqlite3.connect(self.PATH)
-        self.cur = self.con.cursor()
-        self.cur.execute("""CREATE TABLE IF NOT EXISTS "dns" (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    alias VARCHAR UNIQUE NOT NULL,
-                    address VARCHAR UNIQUE NOT NULL)""")
+        self._shared = RpiDns.PERSISTENT
+
+        if self._shared:
+            RpiDns._connection_lock.acquire()
+            try:
+                self.con = RpiDns._connect()
+            except BaseException:
+                RpiDns._connection_lock.release()
+                raise
+            self.cur = self.con.cursor()
+        else:
+            self.con = sqlite3.connect(self.PATH, timeout=self.TIMEOUT)
+            try:
+                self.cur = self.con.cursor()
+                self._create_table(self.cur)
+            except BaseException:
+                self.con.close()
+                raise
+
+        self._changes = self.con.total_changes
 
     def __len__(self):
         return len(self.alias())
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.con.rollback()
+        self.close()
+
     def close(self):
-        self.con.commit()
-        self.con.close()
-        del self.con
-        del self.cur
+        """Commits the changes and closes the connection, or releases the shared one. The
+        connection is released even if the commit fails (e.g. 'database is locked')."""
+        try:
+            self.con.commit()
+        finally:
+            if self.con.total_changes != self._changes:
+                RpiDns.invalidate()
+
+            if self._shared:
+                RpiDns._connection_lock.release()
+            else:
+                self.con.close()
+
+            del self.con
+            del self.cur
+
+    @staticmethod
+    def _create_table(cursor):
+        cursor.execute("""CREATE TABLE IF NOT EXISTS "dns" (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    alias VARCHAR UNIQUE NOT NULL,
+                    address VARCHAR UNIQUE NOT NULL)""")
+
+    @staticmethod
+    def _connect() -> sqlite3.Connection:
+        """Returns the connection shared by the whole process, creating it if needed."""
+
+        with RpiDns._connection_lock:
+            if RpiDns._connection is not None and RpiDns._connection_path != RpiDns.PATH:
+                RpiDns.disconnect()
+
+            if RpiDns._connection is None:
+                connection = sqlite3.connect(
+                    RpiDns.PATH, timeout=RpiDns.TIMEOUT, check_same_thread=False)
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.execute('PRAGMA synchronous=NORMAL')
+                RpiDns._create_table(connection.cursor())
+                connection.commit()
+
+                RpiDns._connection = connection
+                RpiDns._connection_path = RpiDns.PATH
+
+            return RpiDns._connection
+
+    @staticmethod
+    def set_persistent(persistent: bool = True):
+        """Enables or disables the use of a single connection for the whole process.
+
+        The shared connection uses WAL journaling, so many processes can read the aliases
+        while another one is writing. It is closed when the process exits.
+
+        """
+
+        RpiDns.PERSISTENT = persistent
+
+        if persistent:
+            atexit.register(RpiDns.disconnect)
+        else:
+            RpiDns.disconnect()
+
+    @staticmethod
+    def disconnect():
+        """Closes the connection shared by the process, if it is open."""
+
+        with RpiDns._connection_lock:
+            if RpiDns._connection is not None:
+                RpiDns._connection.close()
+                RpiDns._connection = None
+                RpiDns._connection_path = None
 
     def _del_alias(self, alias):
+        with self:
+            self.cur.execute('DELETE FROM dns WHERE alias=?', (alias,))
+            deleted = self.cur.rowcount
 
-        try:
-            self.get(alias)
-        except DnsError:
+        if deleted == 0:
             raise DnsError(f'Alias not found ({alias!r})')
 
-        self.cur.execute('DELETE FROM dns WHERE alias=?', (alias,))
-        self.close()
-
     @staticmethod
     def _get_number_subalias(alias):
         return len(alias.split('.'))
@@ -69,29 +237,74 @@ class RpiDns:
         return alias
 
     @staticmethod
-    def alias():
-        """Returns the alias of the addresses stored"""
+    def _stamp():
+        """Returns a cheap fingerprint of the database state.
 
-        self = object.__new__(RpiDns)
-        self.__init__()
-        self.cur.execute("SELECT alias FROM dns")
-        data = tuple((x[0] for x in self.cur.fetchall()))
-        self.close()
+        With the shared connection, PRAGMA data_version changes whenever another connection
+        commits. Otherwise, the mtime and size of the database file and of its WAL file are used.
 
-        return data
+        """
+
+        if RpiDns.PERSISTENT:
+            with RpiDns._connection_lock:
+                return 'data_version', RpiDns._connect().execute(
+                    'PRAGMA data_version').fetchone()[0]
+
+        stamp = []
+        for path in (RpiDns.PATH, RpiDns.PATH + '-wal'):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                if path == RpiDns.PATH:
+                    return None
+                continue
+            stamp += [stat.st_mtime_ns, stat.st_size]
+        return tuple(stamp)
 
     @staticmethod
-    def new_alias(alias, address):
-        self = object.__new__(RpiDns)
-        self.__init__()
+    def invalidate():
+        """Forces the alias table to be reloaded from the database in the next lookup."""
+        RpiDns._cache = None
+        RpiDns._cache_stamp = None
+        RpiDns._fuzzy_index = None
+
+    @staticmethod
+    def table() -> dict:
+        """Returns the alias -> address table.
+
+        The table is loaded once per process and reloaded only when the database file
+        changes, so resolving an alias is a dict lookup.
 
+        """
+
+        with RpiDns._cache_lock:
+            stamp = RpiDns._stamp()
+
+            if RpiDns._cache is None or stamp is None or stamp != RpiDns._cache_stamp:
+                with RpiDns() as self:
+                    self.cur.execute("SELECT alias, address FROM dns")
+                    table = dict(self.cur.fetchall())
+
+                RpiDns._cache = table
+                RpiDns._cache_stamp = stamp
+                RpiDns._fuzzy_index = None
+
+            return RpiDns._cache
+
+    @staticmethod
+    def alias():
+        """Returns the alias of the addresses stored"""
+        return tuple(RpiDns.table())
+
+    @staticmethod
+    def new_alias(alias, address):
         alias = RpiDns.extend_alias(alias)
 
         try:
-            self.cur.execute("INSERT INTO dns VALUES(NULL, ?, ?)", (alias, address), )
+            with RpiDns() as self:
+                self.cur.execute("INSERT INTO dns VALUES(NULL, ?, ?)", (alias, address), )
         except sqlite3.IntegrityError:
             raise DnsError(f'Alias {alias!r} already exists')
-        self.close()
 
     @staticmethod
     def del_alias(alias,error=True):
@@ -125,47 +338,107 @@ class RpiDns:
         alias_windows = 'windows.' + alias
         alias_linux = 'linux.' + alias
 
-        RpiDns.new_alias(alias_windows, windows_address)
-        RpiDns.new_alias(alias_linux, linux_address)
+        RpiDns.bulk_import(((alias_windows, windows_address), (alias_linux, linux_address)))
+
+    @staticmethod
+    def bulk_import(aliases) -> int:
+        """Creates many aliases in a single transaction.
+
+        Args:
+            aliases (Union[dict, Iterable[Tuple[str, str]]]): pairs of alias and address.
+
+        Raises:
+            DnsError: if any of the aliases or addresses already exists. In that case no alias
+                is created.
+
+        Returns:
+            int: number of aliases created.
+
+        """
+
+        if isinstance(aliases, dict):
+            aliases = aliases.items()
+
+        data = [(RpiDns.extend_alias(alias), address) for alias, address in aliases]
+
+        try:
+            with RpiDns() as self:
+                self.cur.executemany("INSERT INTO dns VALUES(NULL, ?, ?)", data)
+        except sqlite3.IntegrityError as exc:
+            raise DnsError(f'Alias or address already exists ({exc})')
+
+        return len(data)
+
+    @staticmethod
+    def bulk_export() -> tuple:
+        """Returns all the pairs of alias and address stored, in insertion order."""
+
+        with RpiDns() as self:
+            self.cur.execute("SELECT alias, address FROM dns ORDER BY id")
+            data = tuple(self.cur.fetchall())
+
+        return data
 
     @staticmethod
     def _similar(this, other):
         """Returns the similarity between this and other in the interval [0,1]."""
         return SequenceMatcher(None, this, other).ratio()
 
-    def _get(self, alias):
+    @staticmethod
+    def _get(alias, table):
         """Returns the address whose alias is more close to alias."""
 
-        if len(self) == 0:
+        if len(table) == 0:
             raise DnsError('Emtpy dns')
 
-        ratios = {x: self._similar(alias.lower(), x.lower()) for x in self.alias()}
-        max_ratio = max(ratios.values())
+        with RpiDns._cache_lock:
+            if RpiDns._fuzzy_index is None:
+                RpiDns._fuzzy_index = FuzzyAliasIndex(table)
+            index = RpiDns._fuzzy_index
 
-        if max_ratio < 0.9:
-            raise DnsError(f'Not enough similarity ({max_ratio * 100:.2f} %)')
+        key, max_ratio = index.search(alias)
 
-        for key, value in ratios.items():
-            if max_ratio == value:
-                self.cur.execute("SELECT address FROM dns WHERE alias=?", (key,))
-                data = self.cur.fetchone()
-                return data[0]
+        if key is None:
+            raise DnsError(f'Not enough similarity ({max_ratio * 100:.2f} %)')
 
-        raise UnknownError('FATAL ERROR')
+        try:
+            return table[key]
+        except KeyError:
+            raise UnknownError('FATAL ERROR')
 
     @staticmethod
     def get(alias):
         """Returns the address given its alias."""
 
-        self = object.__new__(RpiDns)
-        self.__init__()
-
         alias = RpiDns.extend_alias(alias)
+        table = RpiDns.table()
 
-        if alias not in self.alias():
-            return self._get(alias)
+        try:
+            return table[alias]
+        except KeyError:
+            return RpiDns._get(alias, table)
 
-        self.cur.execute("SELECT address FROM dns WHERE alias=?", (alias,))
-        data = self.cur.fetchone()
-        self.close()
-        return data[0]
+    @staticmethod
+    def resolve_many(*aliases) -> tuple:
+        """Returns the addresses of many aliases, in the same order. The aliases can be
+        passed as arguments or as an iterable.
+
+        All the aliases are resolved against the same snapshot of the alias table, so the
+        database is read at most once.
+
+        """
+
+        if len(aliases) == 1 and not isinstance(aliases[0], str):
+            aliases = tuple(aliases[0])
+
+        table = RpiDns.table()
+        result = []
+
+        for alias in aliases:
+            alias = RpiDns.extend_alias(alias)
+            try:
+                result.append(table[alias])
+            except KeyError:
+                result.append(RpiDns._get(alias, table))
+
+        return tuple(result)
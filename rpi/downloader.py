@@ -2,9 +2,22 @@
 
 """Custom downloader with retries control."""
 
+import asyncio
+import atexit
 import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from urllib.parse import urlparse, urlencode
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from .exceptions import DownloaderError
 
@@ -12,42 +25,564 @@ HEADERS = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleW
                          '(KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
 
 
+class RetryBudget:
+    """Limits the number of retries per host in a window of time, so a host that is down does
+    not make every request retry."""
+
+    def __init__(self, retries=30, window=60):
+        self.retries = retries
+        self.window = window
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def consume(self, host: str) -> bool:
+        """Consumes a retry for the host.
+
+        Args:
+            host (str): host of the request.
+
+        Returns:
+            bool: True if the retry can be done, False if the budget of the host is exhausted.
+
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            history = self.hosts.setdefault(host, deque())
+
+            while history and now - history[0] > self.window:
+                history.popleft()
+
+            if len(history) >= self.retries:
+                return False
+
+            history.append(now)
+            return True
+
+
+class ResponseCache:
+    """Persistent cache of responses validated with ETag and Last-Modified headers.
+
+    Only responses with any of those headers are stored. When the total size of the stored
+    bodies exceeds max_size, the least recently used responses are deleted.
+    """
+
+    def __init__(self, path=None, max_size=50 * 1024 * 1024):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+        if self.path is None:
+            from .dns import RpiDns
+            self.path = os.path.join(os.path.dirname(RpiDns.PATH), 'http_cache.sqlite')
+
+        with self.transaction() as con:
+            con.execute("""CREATE TABLE IF NOT EXISTS "responses" (
+                        url VARCHAR PRIMARY KEY NOT NULL,
+                        etag VARCHAR,
+                        last_modified VARCHAR,
+                        encoding VARCHAR,
+                        content BLOB NOT NULL,
+                        size INTEGER NOT NULL,
+                        accessed REAL NOT NULL)""")
+
+    @contextmanager
+    def transaction(self):
+        """Yields a connection to the cache database, commits and closes it."""
+        with self.lock:
+            con = sqlite3.connect(self.path, timeout=30)
+            try:
+                with con:
+                    yield con
+            finally:
+                con.close()
+
+    def lookup(self, url: str):
+        """Returns the etag, last modified date, encoding and content stored for the url, or
+        None if it is not stored."""
+        with self.transaction() as con:
+            return con.execute(
+                'SELECT etag, last_modified, encoding, content FROM responses WHERE url=?',
+                (url,)).fetchone()
+
+    def touch(self, url: str):
+        """Marks the response of the url as used now."""
+        with self.transaction() as con:
+            con.execute('UPDATE responses SET accessed=? WHERE url=?', (time.time(), url))
+
+    def store(self, url: str, response):
+        """Stores a response, if it can be validated later."""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        if etag is None and last_modified is None:
+            return
+
+        content = response.content
+        if len(content) > self.max_size:
+            return
+
+        with self.transaction() as con:
+            con.execute('INSERT OR REPLACE INTO responses VALUES(?, ?, ?, ?, ?, ?, ?)',
+                        (url, etag, last_modified, response.encoding, content, len(content),
+                         time.time()))
+
+            total = con.execute('SELECT TOTAL(size) FROM responses').fetchone()[0]
+            rows = con.execute('SELECT url, size FROM responses ORDER BY accessed').fetchall()
+
+            for old_url, size in rows:
+                if total <= self.max_size:
+                    break
+                con.execute('DELETE FROM responses WHERE url=?', (old_url,))
+                total -= size
+                self.logger.debug('Evicted cached response of %r', old_url)
+
+
+class DownloaderMetrics:
+    """Records the requests made by downloaders: latency histogram, retries, status codes and
+    bytes received, per host.
+
+    Any object with a record method with the same signature can be used as the metrics hook
+    of a Downloader. The metrics are kept in memory and added to the ones stored in a sqlite
+    database by save(), so the requests of many processes (cron jobs) can be summarized.
+    """
+
+    # Upper bounds (seconds) of the latency histogram buckets. The last bucket has no bound.
+    BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, path=None):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+        if self.path is None:
+            from .dns import RpiDns
+            self.path = os.path.join(os.path.dirname(RpiDns.PATH), 'downloader_metrics.sqlite')
+
+    @staticmethod
+    def _empty():
+        return {'requests': 0, 'errors': 0, 'retries': 0, 'bytes': 0, 'time': 0.0,
+                'statuses': Counter(), 'latency': Counter()}
+
+    @staticmethod
+    def bucket(elapsed: float) -> str:
+        """Returns the name of the latency bucket of a request."""
+        for bound in DownloaderMetrics.BUCKETS:
+            if elapsed <= bound:
+                return f'<={bound}s'
+        return f'>{DownloaderMetrics.BUCKETS[-1]}s'
+
+    def record(self, method: str, url: str, status, elapsed: float, size: int, retries: int):
+        """Records a request.
+
+        Args:
+            method (str): http method.
+            url (str): url requested.
+            status (Union[int, None]): status code of the response, None if it failed.
+            elapsed (float): seconds since the request started, including retries.
+            size (int): bytes of the body of the response.
+            retries (int): retries done.
+
+        """
+        host = urlparse(url).netloc
+
+        with self.lock:
+            stats = self.hosts.setdefault(host, self._empty())
+            stats['requests'] += 1
+            stats['retries'] += retries
+            stats['bytes'] += size
+            stats['time'] += elapsed
+            stats['latency'][self.bucket(elapsed)] += 1
+
+            if status is None:
+                stats['errors'] += 1
+                stats['statuses']['error'] += 1
+            else:
+                stats['statuses'][str(status)] += 1
+
+    def save(self):
+        """Adds the metrics recorded to the database and clears them. It is called at exit,
+        so if the database can not be written the error is only logged."""
+        with self.lock:
+            hosts, self.hosts = self.hosts, {}
+
+        rows = self._rows(hosts)
+
+        if not rows:
+            return
+
+        try:
+            con = sqlite3.connect(self.path, timeout=30)
+            try:
+                with con:
+                    self._create_table(con)
+                    # Not an upsert (INSERT ... ON CONFLICT), which needs sqlite 3.24.
+                    con.executemany('INSERT OR IGNORE INTO metrics VALUES(?, ?, 0)',
+                                    [row[:2] for row in rows])
+                    con.executemany(
+                        'UPDATE metrics SET value = value + ? WHERE host=? AND metric=?',
+                        [(value, host, metric) for host, metric, value in rows])
+            finally:
+                con.close()
+        except sqlite3.Error as exc:
+            self.logger.error('Could not save downloader metrics in %r: %r', self.path, exc)
+
+    @staticmethod
+    def _rows(hosts) -> list:
+        """Flattens the metrics into (host, metric, value) rows. The counts of statuses and
+        latency buckets are stored as metric:key."""
+        rows = []
+        for host, stats in hosts.items():
+            for metric, value in stats.items():
+                if isinstance(value, Counter):
+                    rows += [(host, f'{metric}:{key}', count) for key, count in value.items()]
+                else:
+                    rows.append((host, metric, value))
+        return rows
+
+    @staticmethod
+    def _create_table(con):
+        con.execute("""CREATE TABLE IF NOT EXISTS "metrics" (
+                    host VARCHAR NOT NULL,
+                    metric VARCHAR NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (host, metric))""")
+
+    def summary(self) -> dict:
+        """Returns the metrics stored in the database plus the ones recorded and not saved.
+
+        Returns:
+            dict: host -> metrics. statuses and latency are dicts of counts.
+
+        """
+        result = {}
+
+        if os.path.isfile(self.path):
+            con = sqlite3.connect(self.path, timeout=30)
+            try:
+                self._create_table(con)
+                rows = con.execute('SELECT host, metric, value FROM metrics').fetchall()
+            finally:
+                con.close()
+        else:
+            rows = []
+
+        with self.lock:
+            rows += self._rows(self.hosts)
+
+        for host, metric, value in rows:
+            stats = result.setdefault(host, self._empty())
+            if ':' in metric:
+                metric, key = metric.split(':', 1)
+                stats[metric][key] += int(value)
+            elif metric == 'time':
+                stats[metric] += value
+            else:
+                stats[metric] += int(value)
+
+        for stats in result.values():
+            stats['statuses'] = dict(stats['statuses'])
+            stats['latency'] = dict(stats['latency'])
+
+        return result
+
+    def reset(self):
+        """Deletes all the metrics, recorded and stored."""
+        with self.lock:
+            self.hosts = {}
+
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+    def format_summary(self) -> str:
+        """Returns the summary as a human readable table."""
+        lines = []
+
+        for host, stats in sorted(self.summary().items()):
+            average = stats['time'] / stats['requests'] if stats['requests'] else 0
+            lines.append(f'{host}: {stats["requests"]} requests, {stats["errors"]} errors, '
+                         f'{stats["retries"]} retries, {stats["bytes"]} bytes, '
+                         f'{average:.3f}s average')
+
+            statuses = ', '.join(f'{key}={value}' for key, value in sorted(
+                stats['statuses'].items()))
+            lines.append(f'    status: {statuses}')
+
+            buckets = [self.bucket(bound) for bound in self.BUCKETS]
+            buckets.append(self.bucket(float('inf')))
+            latency = ', '.join(f'{bucket}={stats["latency"][bucket]}' for bucket in buckets
+                                if bucket in stats['latency'])
+            lines.append(f'    latency: {latency}')
+
+        return '\n'.join(lines)
+
+
 class Downloader(requests.Session):
-    """Downloader with retries control."""
+    """Downloader with retries control.
+
+    Connection errors are retried with exponential backoff and jitter, limited by a retry
+    budget per host. Connections are kept alive in a pool, so the shared instance returned by
+    Downloader.shared() should be used instead of creating new ones.
+    """
 
-    def __init__(self, retries=10, silenced=False):
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, retries=10, silenced=False, backoff=0.5, max_backoff=30, pool_size=10,
+                 budget=None, cache=None, metrics=None):
         self.logger = logging.getLogger(__name__)
 
         if silenced is True:
             self.logger.handlers = []
 
         self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._budget = budget or RetryBudget()
+        self.cache = cache
+        self.metrics = metrics
         super().__init__()
 
-    def get(self, url, **kwargs):
-        self.logger.debug('GET %r', url)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    @classmethod
+    def shared(cls):
+        """Returns a Downloader shared by the whole process."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                metrics = DownloaderMetrics()
+                atexit.register(metrics.save)
+                cls._shared = cls(metrics=metrics)
+            return cls._shared
+
+    def backoff_time(self, attempt: int) -> float:
+        """Returns the seconds to wait before a retry: exponential backoff with jitter.
+
+        Args:
+            attempt (int): number of the retry, starting by 0.
+
+        Returns:
+            float: seconds to wait.
+
+        """
+        delay = min(self._max_backoff, self._backoff * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _retry_delay(self, method, host, retries, attempt):
+        """Returns the seconds to wait before the next retry, or None if the request must not
+        be retried. retries is the number of retries left after the failed attempt."""
+        self.logger.warning('Connection error in %s, retries=%s', method, retries)
+
+        if retries == 0:
+            return None
+
+        if self._budget.consume(host) is False:
+            self.logger.error('Retry budget exhausted for %r', host)
+            return None
+
+        return self.backoff_time(attempt)
+
+    def _record(self, method, url, response, start, retries):
+        """Records a request in the metrics hook, if there is one."""
+        if self.metrics is None:
+            return
+
+        elapsed = time.monotonic() - start
+        if response is None:
+            self.metrics.record(method, url, None, elapsed, 0, retries)
+        else:
+            self.metrics.record(method, url, response.status_code, elapsed,
+                                len(response.content or b''), retries)
+
+    def _retry(self, method, url, function, **kwargs):
+        host = urlparse(url).netloc
         retries = self._retries
+        attempt = 0
+        start = time.monotonic()
 
         while retries > 0:
             try:
-                return super().get(url, **kwargs)
+                response = function(url=url, **kwargs)
+                self._record(method, url, response, start, attempt)
+                return response
             except requests.exceptions.ConnectionError:
                 retries -= 1
-                self.logger.warning('Connection error in GET, retries=%s', retries)
+                delay = self._retry_delay(method, host, retries, attempt)
+
+                if delay is None:
+                    break
+
+                time.sleep(delay)
+                attempt += 1
 
-        self.logger.critical('Download error in GET %r', url)
+        self._record(method, url, None, start, attempt)
+        self.logger.critical('Download error in %s %r', method, url)
         raise DownloaderError('max retries failed.')
 
+    def get(self, url, cached=False, **kwargs):
+        """Sends a GET request.
+
+        Args:
+            url (str): url to download.
+            cached (bool): if True, the response is stored in the response cache and the next
+                requests are conditional (If-None-Match, If-Modified-Since). If the server
+                answers 304, the stored body is returned.
+            **kwargs: passed to requests.
+
+        """
+        self.logger.debug('GET %r', url)
+
+        if cached is False:
+            return self._retry('GET', url, super().get, **kwargs)
+
+        if self.cache is None:
+            self.cache = ResponseCache()
+
+        key = url
+        if kwargs.get('params'):
+            key += ('&' if '?' in url else '?') + urlencode(kwargs['params'], doseq=True)
+
+        entry = self.cache.lookup(key)
+        if entry is not None:
+            etag, last_modified, encoding, content = entry
+            headers = dict(kwargs.get('headers') or {})
+
+            if etag is not None:
+                headers['If-None-Match'] = etag
+            if last_modified is not None:
+                headers['If-Modified-Since'] = last_modified
+
+            kwargs['headers'] = headers
+
+        response = self._retry('GET', url, super().get, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            self.logger.debug('Not modified, using cached response - %r', url)
+            response.status_code = 200
+            response.encoding = encoding
+            response._content = content
+            response.from_cache = True
+            self.cache.touch(key)
+            return response
+
+        response.from_cache = False
+        if response.status_code == 200:
+            self.cache.store(key, response)
+
+        return response
+
     def post(self, url, data=None, json=None, **kwargs):
         self.logger.debug('POST %r', url)
-        retries = self._retries
+        return self._retry('POST', url, super().post, data=data, json=json, **kwargs)
+
+
+class AsyncDownloader:
+    """Asyncio interface of a Downloader, to make many requests concurrently.
+
+    Requests are run by a fixed number of workers sharing the connection pool of the
+    downloader, so at most `concurrency` requests are in flight. Retries have the same
+    semantics as in Downloader, but the backoff is awaited instead of blocking a worker.
+    """
+
+    def __init__(self, downloader=None, concurrency=10):
+        self.logger = logging.getLogger(__name__)
+        self.downloader = downloader or Downloader.shared()
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix='downloader')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Stops the workers, waiting for the running requests."""
+        self.executor.shutdown(wait=True)
+
+    async def _retry(self, method, url, function, **kwargs):
+        loop = asyncio.get_event_loop()
+        host = urlparse(url).netloc
+        retries = self.downloader._retries
+        attempt = 0
+        start = time.monotonic()
 
         while retries > 0:
             try:
-                return super().post(url=url, data=data, json=json, **kwargs)
+                response = await loop.run_in_executor(
+                    self.executor, partial(function, self.downloader, url=url, **kwargs))
+                self.downloader._record(method, url, response, start, attempt)
+                return response
             except requests.exceptions.ConnectionError:
                 retries -= 1
-                self.logger.warning('Connection error in POST, retries=%s', retries)
+                delay = self.downloader._retry_delay(method, host, retries, attempt)
+
+                if delay is None:
+                    break
+
+                await asyncio.sleep(delay)
+                attempt += 1
 
-        self.logger.critical('Download error in POST %r', url)
+        self.downloader._record(method, url, None, start, attempt)
+        self.logger.critical('Download error in %s %r', method, url)
         raise DownloaderError('max retries failed.')
+
+    async def get(self, url, cached=False, **kwargs):
+        """Sends a GET request. See Downloader.get."""
+        self.logger.debug('GET %r', url)
+
+        if cached is True:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                self.executor, partial(self.downloader.get, url, cached=True, **kwargs))
+
+        return await self._retry('GET', url, requests.Session.get, **kwargs)
+
+    async def post(self, url, data=None, json=None, **kwargs):
+        """Sends a POST request. See Downloader.post."""
+        self.logger.debug('POST %r', url)
+        return await self._retry('POST', url, requests.Session.post, data=data, json=json,
+                                 **kwargs)
+
+    async def get_many(self, urls, **kwargs) -> list:
+        """Downloads many urls concurrently.
+
+        Args:
+            urls (Iterable[str]): urls to download.
+            **kwargs: passed to get.
+
+        Returns:
+            list: responses, in the same order as urls. If a url fails, the exception raised
+                (usually DownloaderError) is returned instead of its response.
+
+        """
+        return await asyncio.gather(*(self.get(url, **kwargs) for url in urls),
+                                    return_exceptions=True)
+
+    @staticmethod
+    def download_many(urls, concurrency=10, downloader=None, **kwargs) -> list:
+        """Downloads many urls concurrently from synchronous code.
+
+        Args:
+            urls (Iterable[str]): urls to download.
+            concurrency (int): maximum number of requests in flight.
+            downloader (Downloader): downloader whose connection pool, retries and cache are
+                used. By default, the shared one.
+            **kwargs: passed to get.
+
+        Returns:
+            list: responses, in the same order as urls. If a url fails, the exception raised
+                (usually DownloaderError) is returned instead of its response.
+
+        """
+        with AsyncDownloader(downloader, concurrency) as self:
+            # Not asyncio.run, which needs python 3.7.
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(self.get_many(urls, **kwargs))
+            finally:
+                loop.close()
@@ -2,22 +2,177 @@
 
 """Defines the launchers used by users to get notifications."""
 
+import atexit
 import logging
+import threading
+import time
 from typing import Union
 
 from telegram import Bot
+from telegram.error import RetryAfter
 
 from rpi.managers.config_manager import ConfigManager
 from .downloader import Downloader
 from .exceptions import DownloaderError, UserError
 
 
+class TokenBucket:
+    """Rate limiter: allows `rate` operations per second, with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns the seconds to wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        """Takes a token, waiting until it is available."""
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+
+class TelegramDispatcher:
+    """Sends Telegram messages with a bot shared by the process, respecting the rate limits of
+    Telegram: GLOBAL_RATE messages per second in total and CHAT_RATE messages per second to the
+    same chat. If Telegram still answers with RetryAfter, the message is sent again after the
+    time requested, up to RETRIES times.
+    """
+
+    GLOBAL_RATE = 30
+    CHAT_RATE = 1
+    RETRIES = 3
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.global_bucket = TokenBucket(self.GLOBAL_RATE)
+        self.chat_buckets = {}
+        self.lock = threading.Lock()
+        self._bot = None
+        self._token = None
+
+    @classmethod
+    def shared(cls):
+        """Returns the dispatcher shared by the whole process."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @property
+    def bot(self) -> Bot:
+        """Bot of the telegram_bot_token configuration, created again only if it changes."""
+        token = ConfigManager.get('telegram_bot_token')
+
+        with self.lock:
+            if self._bot is None or token != self._token:
+                self._bot = Bot(token)
+                self._token = token
+            return self._bot
+
+    def chat_bucket(self, chat_id: int) -> TokenBucket:
+        """Returns the rate limiter of a chat."""
+        with self.lock:
+            try:
+                return self.chat_buckets[chat_id]
+            except KeyError:
+                bucket = TokenBucket(self.CHAT_RATE)
+                self.chat_buckets[chat_id] = bucket
+                return bucket
+
+    def send(self, chat_id: int, text: str):
+        """Sends a message, waiting for the rate limits.
+
+        Args:
+            chat_id (int): chat to send the message to.
+            text (str): message.
+
+        Raises:
+            RetryAfter: if Telegram keeps limiting the requests after RETRIES retries.
+
+        """
+        bot = self.bot
+        chat_bucket = self.chat_bucket(chat_id)
+
+        for retry in range(self.RETRIES + 1):
+            chat_bucket.acquire()
+            self.global_bucket.acquire()
+
+            try:
+                return bot.send_message(chat_id=chat_id, text=text)
+            except RetryAfter as exc:
+                if retry == self.RETRIES:
+                    raise
+                self.logger.warning('Telegram rate limit reached, retrying after %ss',
+                                    exc.retry_after)
+                time.sleep(exc.retry_after)
+
+    def send_many(self, messages) -> dict:
+        """Sends many messages, interleaving the chats so a chat with many messages does not
+        delay the rest.
+
+        Args:
+            messages (Iterable[Tuple[int, str]]): pairs of chat id and text.
+
+        Returns:
+            dict: chat_id -> list with True for each message sent, or the error raised.
+
+        """
+        queues = {}
+        for chat_id, text in messages:
+            queues.setdefault(chat_id, []).append(text)
+
+        results = {chat_id: [] for chat_id in queues}
+        position = 0
+
+        while queues:
+            for chat_id in list(queues):
+                texts = queues[chat_id]
+                try:
+                    self.send(chat_id, texts[position])
+                    results[chat_id].append(True)
+                except Exception as exc:
+                    self.logger.error('Error sending telegram message to %r: %r', chat_id, exc)
+                    results[chat_id].append(exc)
+
+                if position + 1 >= len(texts):
+                    del queues[chat_id]
+            position += 1
+
+        return results
+
+
 class BaseLauncher:
     """Clase base para lanzar notificadores."""
 
+    # Seconds during which the messages to the same destination are coalesced. 0 disables the
+    # digest mode.
+    DIGEST_WINDOW = 0
+    DIGEST_SEPARATOR = '\n\n'
+
+    _digests = {}
+    _digests_lock = threading.Lock()
+    _flush_registered = False
+
     def __init__(self, downloader=None):
         if downloader is None:
-            self._downloader = Downloader()
+            self._downloader = Downloader.shared()
         else:
             self._downloader = downloader
 
@@ -32,10 +187,104 @@ class BaseLauncher:
     def __str__(self):
         return type(self).__name__
 
-    def fire(self, title, message):
-        """Lanza un mensaje con la información ``data``."""
+    def fire(self, title, message, digest=True):
+        """Lanza un mensaje con la información ``data``.
+
+        If DIGEST_WINDOW is not 0 and digest is True, the message is not sent at once: the
+        messages fired to the same destination in the next DIGEST_WINDOW seconds are sent
+        together in one delivery. In that case fire returns before sending anything, so the
+        errors sending the digest are only logged and never reach the caller. Pass
+        digest=False to send the message at once and get the errors.
+        """
+        if not self.DIGEST_WINDOW or digest is False:
+            return self.send(title, message)
+
+        key = self.digest_key()
+
+        with BaseLauncher._digests_lock:
+            try:
+                BaseLauncher._digests[key][1].append((title, message))
+                return
+            except KeyError:
+                timer = threading.Timer(self.DIGEST_WINDOW, BaseLauncher.flush_digest, (key,))
+                timer.daemon = True
+                BaseLauncher._digests[key] = (self, [(title, message)], timer)
+
+                # The timers are daemon threads, killed at exit with their messages.
+                if BaseLauncher._flush_registered is False:
+                    atexit.register(BaseLauncher.flush_digests)
+                    BaseLauncher._flush_registered = True
+
+        timer.start()
+        self.logger.debug('Started digest of %r for %ss', key, self.DIGEST_WINDOW)
+
+    def send(self, title, message):
+        """Sends a message to the destination of the launcher."""
         raise NotImplementedError
 
+    def digest_key(self) -> tuple:
+        """Returns the key of the destination of the launcher. Messages with the same key are
+        coalesced in digest mode."""
+        return type(self).__name__, self.url, self.chat_id, getattr(self, 'config', None)
+
+    def join_messages(self, messages) -> tuple:
+        """Returns the title and message of a delivery containing many messages.
+
+        Args:
+            messages (List[Tuple[str, str]]): titles and messages.
+
+        Returns:
+            tuple: title and message.
+
+        """
+        if len(messages) == 1:
+            return messages[0]
+
+        if len({title for title, _ in messages}) == 1:
+            return messages[0][0], self.DIGEST_SEPARATOR.join(
+                message for _, message in messages)
+
+        return f'{len(messages)} notificaciones', self.DIGEST_SEPARATOR.join(
+            f'{title}: {message}' for title, message in messages)
+
+    @staticmethod
+    def set_digest(window: float):
+        """Enables the digest mode in every launcher, or disables it if window is 0.
+
+        Args:
+            window (float): seconds during which messages to the same destination are
+                coalesced.
+
+        """
+        BaseLauncher.DIGEST_WINDOW = window
+
+    @staticmethod
+    def flush_digest(key):
+        """Sends the messages coalesced for a destination."""
+        with BaseLauncher._digests_lock:
+            try:
+                launcher, messages, timer = BaseLauncher._digests.pop(key)
+            except KeyError:
+                return
+
+        timer.cancel()
+        title, message = launcher.join_messages(messages)
+        launcher.logger.debug('Sending digest of %d messages to %r', len(messages), key)
+
+        try:
+            launcher.send(title, message)
+        except Exception as exc:
+            launcher.logger.error('Error sending digest to %r: %r', key, exc)
+
+    @staticmethod
+    def flush_digests():
+        """Sends all the messages coalesced and not sent yet. Called at exit."""
+        with BaseLauncher._digests_lock:
+            keys = list(BaseLauncher._digests)
+
+        for key in keys:
+            BaseLauncher.flush_digest(key)
+
     def to_json(self):
         """Devuelve el launcher serializado en json."""
         raise NotImplementedError
@@ -44,7 +293,7 @@ class BaseLauncher:
 class InvalidLauncher(BaseLauncher):
     """An invalid launcher"""
 
-    def fire(self, title, message):
+    def fire(self, title, message, digest=True):
         raise NotImplementedError
 
     def to_json(self):
@@ -54,7 +303,7 @@ class InvalidLauncher(BaseLauncher):
 class BaseExtendedLauncher(BaseLauncher):
     """Clase base para Launchers que permiten mensajes multilínea."""
 
-    def fire(self, title, message):
+    def send(self, title, message):
         raise NotImplementedError
 
     def to_json(self):
@@ -64,7 +313,9 @@ class BaseExtendedLauncher(BaseLauncher):
 class BaseMinimalLauncher(BaseLauncher):
     """Clase base para Launchers que no permiten mensajes multilínea."""
 
-    def fire(self, title, message):
+    DIGEST_SEPARATOR = ' | '
+
+    def send(self, title, message):
         raise NotImplementedError
 
     def to_json(self):
@@ -78,13 +329,14 @@ class IftttLauncher(BaseExtendedLauncher):
         super().__init__(downloader)
         self.url = url
 
-    def fire(self, title, message):
+    def send(self, title, message):
         report = {'value1': title, 'value2': message}
         try:
             self._downloader.post(self.url, data=report)
             self.logger.debug('IftttLauncher Fired')
         except DownloaderError:
             self.logger.error('DownloadError in IftttLauncher')
+            raise
 
     def to_json(self):
         return {"type": "IFTTT", "url": self.url}
@@ -98,17 +350,19 @@ class TelegramLauncher(BaseExtendedLauncher):
 
         self.chat_id = int(chat_id)
 
-    def fire(self, title, message):
-        bot = Bot(ConfigManager.get('telegram_bot_token'))
-
+    def send(self, title, message):
         if self.chat_id is None:
             self.logger.critical('User not confirmed')
             raise UserError('User not confirmed')
 
-        complete_message = title + ':\n' + message
-        bot.send_message(chat_id=self.chat_id, text=complete_message)
+        TelegramDispatcher.shared().send(self.chat_id, self.join_title(title, message))
         self.logger.debug('TelegramLauncher Fired')
 
+    @staticmethod
+    def join_title(title, message) -> str:
+        """Returns the text of the Telegram message of a notification."""
+        return title + ':\n' + message
+
     def to_json(self):
         self.update_status()
         return {"type": "Telegram", "config": str(self.code)}
@@ -128,12 +382,13 @@ class NotifyRunLauncher(BaseMinimalLauncher):
             config = config.replace('/c/', '/')
         self.config = config
 
-    def fire(self, title, message):
+    def send(self, title, message):
         try:
             self._downloader.post(self.config, {'message': message})
             self.logger.debug('NotifyRunLauncher Fired')
         except DownloaderError:
             self.logger.error('DownloadError in NotifyRunLauncher')
+            raise
 
     def to_json(self):
         return {"type": "NotifyRun", "config": self.config}
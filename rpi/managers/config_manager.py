@@ -4,6 +4,11 @@
 Designed to easilly use and store pairs of key - value.
 """
 import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager, suppress
 
 from rpi.dns import RpiDns
 from rpi.exceptions import ConfigNotFoundError, EmptyConfigError, ConfigError
@@ -12,6 +17,11 @@ from rpi.exceptions import ConfigNotFoundError, EmptyConfigError, ConfigError
 class ConfigManager:
     """Configuration manager."""
 
+    _cache = None
+    _cache_stamp = None
+    _cache_lock = threading.Lock()
+    _write_lock = threading.RLock()
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.path = RpiDns.get('textdb.config')
@@ -43,23 +53,78 @@ class ConfigManager:
         """Loads configurations from the main file."""
 
         self.logger.debug('Loading config')
+        self.config.update(ConfigManager.snapshot(self.path))
+
+    @staticmethod
+    def parse(path: str) -> dict:
+        """Reads and parses a configuration file.
+
+        Args:
+            path (str): path of the configuration file.
+
+        Returns:
+            dict: configurations of the file.
+
+        """
         try:
-            with open(self.path, 'rt', encoding='utf-8') as file_handler:
+            with open(path, 'rt', encoding='utf-8') as file_handler:
                 data = file_handler.read()
         except FileNotFoundError:
-            self.logger.critical('Config file does not exist (%r)', self.path)
-            raise FileNotFoundError(f'Config file does not exist ({self.path!r})')
+            logger = logging.getLogger(__name__)
+            logger.critical('Config file does not exist (%r)', path)
+            raise FileNotFoundError(f'Config file does not exist ({path!r})')
 
+        config = {}
         for line in data.splitlines():
             key, *value = line.split('=')
 
             key = key.strip()
             value = '='.join(value).strip()
 
-            self[key] = value
+            config[key] = value
+
+        return config
+
+    @staticmethod
+    def snapshot(path: str = None) -> dict:
+        """Returns the configurations of the main file. They are parsed once per process and
+        parsed again only if the file's modification time or size changes.
+
+        Args:
+            path (str): path of the configuration file. If it is None, it is resolved with
+                RpiDns.
+
+        Returns:
+            dict: configurations. It is shared, so it must not be modified.
+
+        """
+        if path is None:
+            path = RpiDns.get('textdb.config')
+
+        with ConfigManager._cache_lock:
+            try:
+                stat = os.stat(path)
+                stamp = (path, stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                stamp = None
+
+            if ConfigManager._cache is None or stamp is None or \
+                    stamp != ConfigManager._cache_stamp:
+                ConfigManager._cache = ConfigManager.parse(path)
+                ConfigManager._cache_stamp = stamp
+
+            return ConfigManager._cache
+
+    @staticmethod
+    def invalidate():
+        """Forces the configuration file to be parsed again in the next lookup."""
+        with ConfigManager._cache_lock:
+            ConfigManager._cache = None
+            ConfigManager._cache_stamp = None
 
     def save(self, force: bool = False):
-        """Saves all the configurations in the file.
+        """Saves all the configurations in the file. The file is replaced atomically, so
+        readers never see a half-written configuration.
 
         Args:
             force (bool): tells the function to save configurations even if there are no
@@ -72,8 +137,7 @@ class ConfigManager:
 
         """
 
-        other = ConfigManager.__new__(ConfigManager)
-        other.__init__()
+        other = ConfigManager.snapshot(self.path)
 
         if len(other) > len(self) and force is False:
             self.logger.critical(
@@ -84,10 +148,27 @@ class ConfigManager:
             self.logger.critical('There are no configurations to save')
             raise EmptyConfigError('There are no configurations to save')
 
-        with open(self.path, 'wt', encoding='utf-8') as file_handler:
-            for key, value in self.config.items():
-                file_handler.write(f"{key}={value}\n")
+        directory = os.path.dirname(os.path.abspath(self.path))
+        file_descriptor, temp_path = tempfile.mkstemp(prefix='.config-', dir=directory)
+
+        try:
+            with open(file_descriptor, 'wt', encoding='utf-8') as file_handler:
+                for key, value in self.config.items():
+                    file_handler.write(f"{key}={value}\n")
+
+                file_handler.flush()
+                os.fsync(file_handler.fileno())
+
+            with suppress(FileNotFoundError):
+                shutil.copymode(self.path, temp_path)
+
+            os.replace(temp_path, self.path)
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.remove(temp_path)
+            raise
 
+        ConfigManager.invalidate()
         self.logger.debug('Configurations saved (force=%s)', force)
 
     @staticmethod
@@ -101,15 +182,15 @@ class ConfigManager:
             str:  value for the configuration.
 
         """
-        self = ConfigManager.__new__(ConfigManager)
-        self.__init__()
+        config_dict = ConfigManager.snapshot()
 
-        if config not in self:
-            self.logger.critical('Configuration not found: %r', config)
+        try:
+            valor = config_dict[config]
+        except KeyError:
+            logger = logging.getLogger(__name__)
+            logger.critical('Configuration not found: %r', config)
             raise ConfigNotFoundError(f'Configuration not found: {config!r}')
 
-        valor = self[config]
-
         # self.logger.debug(f'Returning config value {valor!r} from key {config!r}')
 
         return valor
@@ -124,14 +205,21 @@ class ConfigManager:
 
         """
 
-        self = ConfigManager.__new__(ConfigManager)
-        self.__init__()
+        ConfigManager.set_many({config: value})
+
+    @staticmethod
+    def set_many(configs: dict):
+        """Sets many configuration values with a single read and a single write of the file.
 
-        self[config] = value
+        Args:
+            configs (dict): pairs of key - value of the configurations.
 
-        self.logger.debug('Set config value %r with key %r', value, config)
+        """
 
-        self.save()
+        with ConfigManager.transaction() as self:
+            for config, value in configs.items():
+                self[config] = value
+                self.logger.debug('Set config value %r with key %r', value, config)
 
     @staticmethod
     def delete(config: str):
@@ -142,14 +230,31 @@ class ConfigManager:
 
         """
 
-        self = ConfigManager.__new__(ConfigManager)
-        self.__init__()
+        with ConfigManager.transaction(force=True) as self:
+            value_to_delete = self[config]
+
+            del self[config]
+            self.logger.debug('Deleted config value %r with key %r', value_to_delete, config)
 
-        value_to_delete = self[config]
+    @staticmethod
+    @contextmanager
+    def transaction(force: bool = False):
+        """Yields a ConfigManager and saves it when the block ends without errors, so many
+        changes are applied with a single read and a single write of the file. Transactions
+        of the same process are serialized.
 
-        del self[config]
-        self.logger.debug('Deleted config value %r with key %r', value_to_delete, config)
-        self.save(force=True)
+        Args:
+            force (bool): passed to ConfigManager.save. Must be True to delete configurations.
+
+        """
+
+        with ConfigManager._write_lock:
+            self = ConfigManager.__new__(ConfigManager)
+            self.__init__()
+
+            yield self
+
+            self.save(force=force)
 
     @staticmethod
     def list() -> tuple:
@@ -158,11 +263,9 @@ class ConfigManager:
         Returns:
             Tuple[str]: tuple with all the keys.
         """
-        self = ConfigManager.__new__(ConfigManager)
-        self.__init__()
-
-        result = tuple(self.config.keys())
+        result = tuple(ConfigManager.snapshot().keys())
 
-        self.logger.debug('Returning config keys - %s', result)
+        logger = logging.getLogger(__name__)
+        logger.debug('Returning config keys - %s', result)
 
         return result
@@ -2,9 +2,11 @@
 
 """Manager for linux crontab."""
 
+import hashlib
 import logging
 import os
 import re
+from functools import lru_cache
 from typing import Union, List
 
 from crontab import CronTab, CronItem
@@ -14,9 +16,26 @@ from rpi.exceptions import JobNotFoundError, ExistingJobError, InvalidArgumentEr
 from rpi.managers.services_manager import ServicesManager
 
 
+@lru_cache(maxsize=1024)
+def _digest(key: str) -> int:
+    """Returns a deterministic 63 bits hash of a string."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big') >> 1
+
+
 # noinspection PyUnresolvedReferences
 class CrontabManager:
-    """Crontab interface"""
+    """Crontab interface.
+
+    An instance is a session: the crontab is parsed once when it is created, jobs are indexed
+    by user and by hash, and all the changes are written at once with write(). Used as a
+    context manager, changes are written when the block ends without errors.
+
+    CrontabManager.generation is increased every time a session writes the crontab, so the
+    cronitems cached by other objects of the process can be reloaded.
+    """
+
+    generation = 0
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         if operating_system() == 'W':
@@ -24,12 +43,63 @@ class CrontabManager:
         else:
             self.cron = CronTab(user=True)
 
+        self.changed = False
+        self._by_user = None
+        self._by_hash = None
+
     def __iter__(self):
         return iter(self.cron)
 
-    @staticmethod
-    def new(command: str, user: str, hour: int, minutes: int):
-        """Creates a new task for crontab.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.write()
+
+    def _index(self):
+        """Builds the indexes of jobs by user and by hash, if they are not built."""
+        if self._by_user is not None:
+            return
+
+        by_user = {}
+        by_hash = {}
+
+        for job in self.cron:
+            by_user.setdefault(job.comment, []).append(job)
+            by_hash.setdefault(CrontabManager.job_to_hash(job), []).append(job)
+
+        self._by_user = by_user
+        self._by_hash = by_hash
+
+    def jobs_by_user(self, user) -> tuple:
+        """Returns the cronitems that belong to a certain user.
+
+        Args:
+            user (Union[User, str]): user to get the cronitems from.
+
+        Returns:
+            tuple: cronitems of the user.
+
+        """
+        self._index()
+        return tuple(self._by_user.get(CrontabManager.user_to_username(user), ()))
+
+    def jobs_by_hash(self, hashcode: int) -> tuple:
+        """Returns the cronitems with a certain hash.
+
+        Args:
+            hashcode (int): hashcode of the cronitems.
+
+        Returns:
+            tuple: cronitems with that hash.
+
+        """
+        self._index()
+        return tuple(self._by_hash.get(hashcode, ()))
+
+    def add(self, command: str, user: str, hour: int, minutes: int) -> CronItem:
+        """Adds a new task to the session. It is saved by write().
 
         Args:
             command (str): command to execute.
@@ -37,33 +107,37 @@ class CrontabManager:
             hour (int): hour of the time when the command will be executed.
             minutes (int): minutes of the time when the command will be executed.
 
-        """
-        self = CrontabManager.__new__(CrontabManager)
-        self.__init__()
+        Raises:
+            ExistingJobError: if the user already has the same job.
+
+        Returns:
+            CronItem: job created.
 
+        """
         self.logger.debug('Trying to add a CronItem (%r, %r, %r, %r)', command, user, hour, minutes)
         username = CrontabManager.user_to_username(user)
+        self._index()
 
         new_job = self.cron.new(command, comment=username)
         new_job.hour.on(hour)
         new_job.minutes.on(minutes)
 
-        counter = 0
-
-        for job in self.cron.find_comment(username):
-            if CrontabManager.job_to_hash(job) == CrontabManager.job_to_hash(new_job):
-                counter += 1
+        new_hash = CrontabManager.job_to_hash(new_job)
 
-        if counter > 1:
+        if new_hash in self._by_hash:
+            self.cron.remove(new_job)
             self.logger.critical('Job already exists: %r', new_job)
             raise ExistingJobError(f'Job already exists: {new_job!r}')
 
-        self.cron.write()
-        self.logger.debug('Job created and saved successfully')
+        self._by_user.setdefault(username, []).append(new_job)
+        self._by_hash[new_hash] = [new_job]
+        self.changed = True
 
-    @staticmethod
-    def delete_by_anything(anything: Union[CronItem, int, str]):
-        """Deletes a job, regardless the type of anything (almost).
+        return new_job
+
+    def remove(self, anything: Union[CronItem, int, str]) -> tuple:
+        """Removes from the session a job, regardless the type of anything (almost). It is
+        saved by write().
 
         Args:
             anything (Union[CronItem, int, str]): Can be a CronItem, or a hascode.
@@ -72,12 +146,10 @@ class CrontabManager:
             InvalidArgumentError: if anything is not a CronItem, int or str.
             JobNotFoundError: if there is no job with that hashcode.
 
-        """
-        self = CrontabManager.__new__(CrontabManager)
-        self.__init__()
-
-        self.logger.debug('Deleting by anything - %r', anything)
+        Returns:
+            tuple: jobs removed.
 
+        """
         if isinstance(anything, CronItem):
             hashcode = CrontabManager.job_to_hash(anything)
         elif isinstance(anything, int):
@@ -88,38 +160,137 @@ class CrontabManager:
             self.logger.critical('Incorrect type (%r)', type(anything).__name__)
             raise InvalidArgumentError(f'Incorrect type ({type(anything).__name__!r})')
 
-        return self.delete_by_hash(hashcode)
+        self.logger.debug('Trying to delete job by hash - %s', hashcode)
+
+        jobs = self.jobs_by_hash(hashcode)
+
+        if not jobs:
+            self.logger.critical('Can not find job with hash=%r', hashcode)
+            raise JobNotFoundError(f'Can not find job with hash={hashcode!r}')
+
+        self.cron.remove(*jobs)
+
+        del self._by_hash[hashcode]
+        for job in jobs:
+            self._by_user[job.comment].remove(job)
+        self.changed = True
+
+        self.logger.debug('Job successfully deleted - %r', jobs[-1])
+        return jobs
+
+    def sync(self, user, tasks) -> tuple:
+        """Makes the jobs of a user in the session be exactly the tasks given: the missing
+        tasks are added and the jobs that are not in tasks are removed. It is saved by write().
+
+        Args:
+            user (Union[User, str]): user of the tasks.
+            tasks (Iterable[Tuple[str, int, int]]): tasks as tuples of command, hour and minutes.
+
+        Returns:
+            tuple: jobs added and jobs removed.
+
+        """
+        username = CrontabManager.user_to_username(user)
+        desired = {}
+
+        for command, hour, minutes in tasks:
+            job = CronItem(command=command, comment=username)
+            job.hour.on(hour)
+            job.minutes.on(minutes)
+            desired.setdefault(CrontabManager.job_to_hash(job), (command, hour, minutes))
+
+        removed = []
+        for job in self.jobs_by_user(username):
+            hashcode = CrontabManager.job_to_hash(job)
+            if hashcode not in desired and hashcode in self._by_hash:
+                removed.extend(self.remove(hashcode))
+
+        added = []
+        for hashcode, (command, hour, minutes) in desired.items():
+            if hashcode not in self._by_hash:
+                added.append(self.add(command, username, hour, minutes))
+
+        return tuple(added), tuple(removed)
+
+    def write(self):
+        """Writes the changes of the session to the crontab."""
+        if self.changed is False:
+            return
+
+        self.cron.write()
+        self.changed = False
+        CrontabManager.generation += 1
+        self.logger.debug('Crontab saved successfully')
 
     @staticmethod
-    def delete_by_hash(hashcode: int):
-        """Deletes a job given its hash.
+    def apply(plan: dict) -> dict:
+        """Makes the crontab contain exactly the tasks of the plan for each user of the plan,
+        reading and writing the crontab only once. Users not included in the plan are not
+        modified.
 
         Args:
-            hashcode (int): hashcode of the job to delete.
+            plan (dict): user -> iterable of tasks, as tuples of command, hour and minutes.
+
+        Returns:
+            dict: username -> jobs added and jobs removed.
+
+        """
+        result = {}
+
+        with CrontabManager() as self:
+            for user, tasks in plan.items():
+                username = CrontabManager.user_to_username(user)
+                result[username] = self.sync(username, tasks)
+                self.logger.debug('Applied plan for %r: %d added, %d removed', username,
+                                  len(result[username][0]), len(result[username][1]))
+
+        return result
+
+    @staticmethod
+    def new(command: str, user: str, hour: int, minutes: int):
+        """Creates a new task for crontab.
+
+        Args:
+            command (str): command to execute.
+            user (Union[User, str]): user who wants to execute the command.
+            hour (int): hour of the time when the command will be executed.
+            minutes (int): minutes of the time when the command will be executed.
+
+        """
+        with CrontabManager() as self:
+            self.add(command, user, hour, minutes)
+
+        self.logger.debug('Job created and saved successfully')
+
+    @staticmethod
+    def delete_by_anything(anything: Union[CronItem, int, str]):
+        """Deletes a job, regardless the type of anything (almost).
+
+        Args:
+            anything (Union[CronItem, int, str]): Can be a CronItem, or a hascode.
 
         Raises:
+            InvalidArgumentError: if anything is not a CronItem, int or str.
             JobNotFoundError: if there is no job with that hashcode.
 
         """
-        self = CrontabManager.__new__(CrontabManager)
-        self.__init__()
-
-        self.logger.debug('Trying to delete job by hash - %s', hashcode)
+        with CrontabManager() as self:
+            self.logger.debug('Deleting by anything - %r', anything)
+            self.remove(anything)
 
-        select = None
-        jobs = list(self.cron)
+    @staticmethod
+    def delete_by_hash(hashcode: int):
+        """Deletes a job given its hash.
 
-        for job in jobs:
-            if self.job_to_hash(job) == hashcode:
-                select = job
-                self.cron.remove(job)
+        Args:
+            hashcode (int): hashcode of the job to delete.
 
-        if select is None:
-            self.logger.critical('Can not find job with hash=%r', hashcode)
-            raise JobNotFoundError(f'Can not find job with hash={hashcode!r}')
+        Raises:
+            JobNotFoundError: if there is no job with that hashcode.
 
-        self.cron.write()
-        self.logger.debug('Job successfully deleted - %r', select)
+        """
+        with CrontabManager() as self:
+            self.remove(hashcode)
 
     @staticmethod
     def list_by_user(user) -> tuple:
@@ -132,20 +303,29 @@ class CrontabManager:
             tuple: list of cronitems of the user.
 
         """
-        self = CrontabManager.__new__(CrontabManager)
-        self.__init__()
+        return CrontabManager().jobs_by_user(user)
 
-        username = CrontabManager.user_to_username(user)
-        result = tuple(self.cron.find_comment(username))
+    @staticmethod
+    def group_by_user() -> dict:
+        """Returns the cronitems of every user, reading the crontab only once.
 
-        logger = logging.getLogger(__name__)
+        Returns:
+            dict: username -> tuple of cronitems.
 
-        return result
+        """
+        self = CrontabManager.__new__(CrontabManager)
+        self.__init__()
+        self._index()
+
+        return {username: tuple(jobs) for username, jobs in self._by_user.items()}
 
     @staticmethod
     def job_to_hash(job: CronItem) -> int:
         """Returns a hash from a job.
 
+        The hash only depends on the schedule, the command and the comment of the job, so it
+        is the same in every process and it does not change when other jobs change.
+
         Args:
             job (CronItem): job to get the hash from.
 
@@ -153,10 +333,8 @@ class CrontabManager:
             int: hash of the cronitem.
 
         """
-        logger = logging.getLogger(__name__)
-        result = hash(str(vars(job)))
-
-        return result
+        command = ' '.join(job.command.split())
+        return _digest(f'{job.slices} {command} # {job.comment}')
 
     @staticmethod
     def user_to_username(user: str) -> str:
@@ -206,20 +384,19 @@ class CrontabManager:
         except ValueError:
             pass
 
-        for i, _ in enumerate(options):
-            options[i] = options[i].lstrip(service.command.preoption)
+        options_names = service.options_names_set
+        option_namespace = service.option_namespace
+        result = []
+
+        for option in options:
+            option = option.lstrip(service.command.preoption)
+
+            if option not in options_names:
+                continue
 
-        i = 0
-        while i < len(options):
-            if options[i] not in service.options_names:
-                options.remove(options[i])
-                i = 0
-            else:
-                if options[i] in service.option_names_en:
-                    options[i] = service.option_namespace[options[i]]
-                i += 1
+            result.append(option_namespace.get(option) or option)
 
-        options = ' '.join(options)
+        options = ' '.join(result)
 
         if admin is False:
             return service, options
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+"""Password manager for raspberry pi scripts, storing the passwords encrypted in a sqlite
+database."""
+
+import logging
+import os
+import sqlite3
+import threading
+from typing import Tuple
+
+from rpi.dns import RpiDns
+from rpi.encryption import get_fernet
+from rpi.exceptions import MissingKeyError
+
+
+class EncryptedKeysManager:
+    """Manages the passwords, stored encrypted with Fernet in a sqlite database.
+
+    The passwords are decrypted once per process and kept in memory, so after the first lookup
+    getting a password is a dict lookup. The database is read again only if it changes, and
+    only the passwords that changed are decrypted again.
+    """
+
+    # If None, the path is resolved with RpiDns and the key is the aes_key configuration.
+    PATH = None
+    KEY = None
+
+    _cache = None
+    _cache_stamp = None
+    _decrypted = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.path = EncryptedKeysManager.get_path()
+        self.con = sqlite3.connect(self.path)
+        self.cur = self.con.cursor()
+        self.cur.execute("""CREATE TABLE IF NOT EXISTS "keys" (
+                    service VARCHAR PRIMARY KEY NOT NULL,
+                    password BLOB NOT NULL)""")
+
+    def close(self):
+        """Saves changes and closes the database connection."""
+        self.con.commit()
+
+        if self.con.total_changes:
+            EncryptedKeysManager.invalidate()
+
+        self.con.close()
+
+    @staticmethod
+    def get_path() -> str:
+        """Returns the path of the database."""
+        if EncryptedKeysManager.PATH is not None:
+            return EncryptedKeysManager.PATH
+        return RpiDns.get('sqlite.claves')
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return path, stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def snapshot() -> dict:
+        """Returns the passwords decrypted.
+
+        Returns:
+            dict: passwords. It is shared, so it must not be modified.
+
+        """
+        with EncryptedKeysManager._cache_lock:
+            stamp = EncryptedKeysManager._stamp(EncryptedKeysManager.get_path())
+
+            if EncryptedKeysManager._cache is not None and stamp is not None and \
+                    stamp == EncryptedKeysManager._cache_stamp:
+                return EncryptedKeysManager._cache
+
+            self = EncryptedKeysManager.__new__(EncryptedKeysManager)
+            self.__init__()
+            self.cur.execute('SELECT service, password FROM keys')
+            rows = self.cur.fetchall()
+            self.close()
+
+            self.logger.debug('Decrypting keys')
+
+            fernet = None
+            decrypted = {}
+            passwords = {}
+
+            for service, token in rows:
+                try:
+                    passwords[service] = EncryptedKeysManager._decrypted[token]
+                except KeyError:
+                    if fernet is None:
+                        fernet = get_fernet(EncryptedKeysManager.KEY)
+                    passwords[service] = fernet.decrypt(token).decode()
+
+                decrypted[token] = passwords[service]
+
+            if stamp is None:
+                stamp = EncryptedKeysManager._stamp(self.path)
+
+            EncryptedKeysManager._cache = passwords
+            EncryptedKeysManager._cache_stamp = stamp
+            EncryptedKeysManager._decrypted = decrypted
+
+            return passwords
+
+    @staticmethod
+    def invalidate():
+        """Forces the database to be read again in the next lookup."""
+        EncryptedKeysManager._cache = None
+        EncryptedKeysManager._cache_stamp = None
+
+    @staticmethod
+    def keys() -> Tuple[str]:
+        """Returns all the keys for the passwords.
+
+        Returns:
+            Tuple[str]: keys of the passwords
+
+        """
+        result = tuple(EncryptedKeysManager.snapshot().keys())
+
+        logger = logging.getLogger(__name__)
+        logger.debug('Returning list of keys - %r', result)
+
+        return result
+
+    @staticmethod
+    def set(service: str, password: str):
+        """Sets a password given its password and service.
+
+        Args:
+            service (str): service of the password.
+            password (str): password to store.
+
+        """
+        EncryptedKeysManager.set_many({service: password})
+
+    @staticmethod
+    def set_many(passwords: dict):
+        """Sets many passwords in a single transaction.
+
+        Args:
+            passwords (dict): pairs of service - password.
+
+        """
+        fernet = get_fernet(EncryptedKeysManager.KEY)
+        data = [(service, fernet.encrypt(password.encode()))
+                for service, password in passwords.items()]
+
+        self = EncryptedKeysManager.__new__(EncryptedKeysManager)
+        self.__init__()
+
+        for service, _ in data:
+            self.logger.debug('Saving password for key %r', service)
+
+        self.cur.executemany('INSERT OR REPLACE INTO keys VALUES(?, ?)', data)
+        self.close()
+
+        with EncryptedKeysManager._cache_lock:
+            for service, token in data:
+                EncryptedKeysManager._decrypted[token] = passwords[service]
+
+    @staticmethod
+    def delete(service: str):
+        """Deletes the password of a service.
+
+        Args:
+            service (str): service of the password to delete.
+
+        """
+        self = EncryptedKeysManager.__new__(EncryptedKeysManager)
+        self.__init__()
+
+        self.cur.execute('DELETE FROM keys WHERE service=?', (service,))
+        deleted = self.cur.rowcount
+        self.close()
+
+        if deleted == 0:
+            self.logger.critical('Key %r not found', service)
+            raise MissingKeyError(f'Key {service!r} not found')
+
+        self.logger.debug('Deleted password of service %r', service)
+
+    @staticmethod
+    def get(key: str) -> str:
+        """Returns the password of the key.
+
+        Args:
+            key (str): service of the password to get.
+
+        Returns:
+            str: password.
+
+        """
+        return EncryptedKeysManager.get_many(key)[0]
+
+    @staticmethod
+    def get_many(*keys: str) -> Tuple[str]:
+        """Returns the passwords of many keys, in the same order.
+
+        Args:
+            *keys (str): services of the passwords to get.
+
+        Returns:
+            Tuple[str]: passwords.
+
+        """
+        passwords = EncryptedKeysManager.snapshot()
+
+        try:
+            return tuple(passwords[key] for key in keys)
+        except KeyError as exc:
+            logger = logging.getLogger(__name__)
+            logger.critical('Key %r not found', exc.args[0])
+            raise MissingKeyError(f'Key {exc.args[0]!r} not found')
@@ -4,6 +4,8 @@
 
 import json
 import logging
+import os
+import threading
 from typing import Tuple
 
 from rpi.dns import RpiDns
@@ -15,16 +17,56 @@ class KeysManager:
     #  least encrypt the json.
     """Manages the passwords."""
 
+    _cache = None
+    _cache_stamp = None
+    _cache_lock = threading.Lock()
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.path = RpiDns.get('json.claves')
+        self.dict = dict(KeysManager.snapshot(self.path))
+
+    @staticmethod
+    def snapshot(path: str = None) -> dict:
+        """Returns the passwords stored in the keys file. The file is parsed once per process
+        and parsed again only if its modification time or size changes.
+
+        Args:
+            path (str): path of the keys file. If it is None, it is resolved with RpiDns.
+
+        Returns:
+            dict: passwords. It is shared, so it must not be modified.
 
-        try:
-            with open(self.path) as file_handler:
-                self.dict = json.load(file_handler)
-        except FileNotFoundError:
-            self.logger.critical('Keys file not found (%r)', self.path)
-            raise FileNotFoundError(f'Keys file not found ({self.path!r})')
+        """
+        if path is None:
+            path = RpiDns.get('json.claves')
+
+        with KeysManager._cache_lock:
+            try:
+                stat = os.stat(path)
+                stamp = (path, stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                stamp = None
+
+            if KeysManager._cache is None or stamp is None or stamp != KeysManager._cache_stamp:
+                try:
+                    with open(path) as file_handler:
+                        KeysManager._cache = json.load(file_handler)
+                except FileNotFoundError:
+                    logger = logging.getLogger(__name__)
+                    logger.critical('Keys file not found (%r)', path)
+                    raise FileNotFoundError(f'Keys file not found ({path!r})')
+
+                KeysManager._cache_stamp = stamp
+
+            return KeysManager._cache
+
+    @staticmethod
+    def invalidate():
+        """Forces the keys file to be parsed again in the next lookup."""
+        with KeysManager._cache_lock:
+            KeysManager._cache = None
+            KeysManager._cache_stamp = None
 
     @staticmethod
     def keys() -> Tuple[str]:
@@ -34,12 +76,10 @@ class KeysManager:
             Tuple[str]: keys of the passwords
 
         """
-        self = object.__new__(KeysManager)
-        self.__init__()
+        result = tuple(KeysManager.snapshot().keys())
 
-        result = tuple(self.dict.keys())
-
-        self.logger.debug('Returning list of keys - %r', result)
+        logger = logging.getLogger(__name__)
+        logger.debug('Returning list of keys - %r', result)
 
         return result
 
@@ -49,10 +89,11 @@ class KeysManager:
             with open(self.path, 'wt') as file_handler:
                 json.dump(self.dict, file_handler, ensure_ascii=False, indent=4, sort_keys=True)
 
+        KeysManager.invalidate()
         self.logger.debug('Saved keys successfully')
 
     def delete(self, service):
-        if service not in self.keys():
+        if service not in self.dict:
             self.logger.critical('Key %r not found', service)
             raise MissingKeyError(f'Key {service!r} not found')
 
@@ -89,15 +130,32 @@ class KeysManager:
             str: password.
 
         """
-        self = object.__new__(KeysManager)
-        self.__init__()
+        return KeysManager.get_many(key)[0]
+
+    @staticmethod
+    def get_many(*keys: str) -> Tuple[str]:
+        """Returns the passwords of many keys, in the same order.
+
+        Args:
+            *keys (str): services of the passwords to get.
+
+        Returns:
+            Tuple[str]: passwords.
+
+        """
+        logger = logging.getLogger(__name__)
+        passwords = KeysManager.snapshot()
+        result = []
 
-        self.logger.debug('Searching key for %r', key)
+        for key in keys:
+            logger.debug('Searching key for %r', key)
 
-        if key not in self.keys():
-            self.logger.critical('Key %r not found', key)
-            raise MissingKeyError(f'Key {key!r} not found')
+            try:
+                result.append(passwords[key])
+            except KeyError:
+                logger.critical('Key %r not found', key)
+                raise MissingKeyError(f'Key {key!r} not found')
 
-        self.logger.debug('Password found for key %r', key)
+            logger.debug('Password found for key %r', key)
 
-        return self.dict[key]
+        return tuple(result)
@@ -4,8 +4,11 @@
 
 import logging
 import os
+import re
 from dataclasses import dataclass, field
 from enum import Enum
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Tuple, Union
 from warnings import warn
 
@@ -79,39 +82,60 @@ class RaspberryService:
             self.options = tuple()
 
         self.all_paths = self.extra_paths + (self.path,)
+        self.update_namespaces()
 
     def __repr__(self):
         return f"RaspberryService({self.name})"
 
+    def update_namespaces(self):
+        """Computes the option names and filenames. Must be called again if the options or the
+        paths change."""
+        self._option_namespace = MappingProxyType(
+            {option.name: option.es for option in self.options})
+        self._option_names_en = tuple(self._option_namespace.keys())
+        self._option_names_es = tuple(
+            [x for x in self._option_namespace.values() if x is not None])
+        self._options_names = self._option_names_en + self._option_names_es
+        self._options_names_set = frozenset(self._options_names)
+
+        self._filenames_with_ext = tuple([os.path.basename(x).lower() for x in self.all_paths])
+        self._filenames_without_ext = tuple(
+            os.path.splitext(x)[0].lower() for x in self._filenames_with_ext)
+
     @property
     def options_names(self) -> tuple:
         """Returns all the option names, both english names and spanish names."""
-        return tuple(self.option_names_en + self.option_names_es)
+        return self._options_names
+
+    @property
+    def options_names_set(self) -> frozenset:
+        """Returns all the option names, both english names and spanish names, as a set."""
+        return self._options_names_set
 
     @property
     def option_names_en(self) -> tuple:
         """Returns the option names in english."""
-        return tuple(self.option_namespace.keys())
+        return self._option_names_en
 
     @property
     def option_names_es(self) -> tuple:
         """Returns the option names in spanish"""
-        return tuple([x for x in self.option_namespace.values() if x is not None])
+        return self._option_names_es
 
     @property
-    def option_namespace(self) -> dict:
+    def option_namespace(self) -> MappingProxyType:
         """Returns a dict of option language transformation: english_name -> spanish_name."""
-        return {option.name: option.es for option in self.options}
+        return self._option_namespace
 
     @property
     def filenames_with_ext(self):
         """list of filenames with extension (enviar.py, aemet.py, ...)."""
-        return tuple([os.path.basename(x).lower() for x in self.all_paths])
+        return self._filenames_with_ext
 
     @property
     def filenames_without_ext(self) -> tuple:
         """list of filenames without extension (enviar, aemet, ...)."""
-        return tuple(os.path.splitext(x)[0].lower() for x in self.filenames_with_ext)
+        return self._filenames_without_ext
 
     def corresponds_with(self, other: str) -> bool:
         """Checks if the string corresponds with this service. It checks the service name and
@@ -154,7 +178,7 @@ class RaspberryService:
 
         try:
             for opt in kwargs['OPTIONS']:
-                if opt not in self.options_names:
+                if opt not in self.options_names_set:
                     raise InvalidOptionError(
                         f'Option {opt!r} is not registered ({self.options_names!r})')
         except KeyError:
@@ -285,35 +309,78 @@ class ServicesManager(Enum):
             return basepath.value
 
         basepath = os.path.basename(basepath).lower()
-        for servicio in ServicesManager:
-            if servicio.value.corresponds_with(basepath):
-                return servicio.value
 
-        logger.warning("Unkown service: %r", basepath)
-        # warn(f"Unkown service: {basepath!r}", UnrecognisedServiceWarning)
+        try:
+            return SERVICES_BY_IDENTIFIER[basepath]
+        except KeyError:
+            pass
+
+        if basepath not in UNKNOWN_IDENTIFIERS:
+            UNKNOWN_IDENTIFIERS.add(basepath)
+            logger.warning("Unkown service: %r", basepath)
+            # warn(f"Unkown service: {basepath!r}", UnrecognisedServiceWarning)
+
         return ServicesManager.UNKNOWN.value
 
-    # noinspection PyTypeChecker
     @staticmethod
     def eval(string_to_evaluate: str) -> Tuple[RaspberryService]:
         """Returns a list of services from a string representation of a list of services."""
+        return parse_services(string_to_evaluate)
 
-        logger = logging.getLogger(__name__)
-        try:
-            data = eval(string_to_evaluate, globals(), ServicesManager.__dict__)
-        except SyntaxError:
-            return tuple()
 
-        try:
-            data = list(data)
-        except TypeError:
-            data = [data, ]
+def _build_services_index() -> MappingProxyType:
+    """Returns a read only dict to get a service by any of its identifiers: its name and its
+    filenames with and without extension (the first service defined wins)."""
+    index = {}
+    for service in ServicesManager:
+        service = service.value
+        identifiers = (service.name.lower(),) + service.filenames_with_ext + \
+            service.filenames_without_ext
+
+        for identifier in identifiers:
+            index.setdefault(identifier, service)
+
+    return MappingProxyType(index)
+
 
-        for i, _ in enumerate(data):
-            try:
-                data[i]: RaspberryService = data[i].value
-            except AttributeError:
-                warn(f"Something may have gone wrong (data={data!r})", UnexpectedBehaviourWarning)
-                logger.warning("Something may have gone wrong (data=%r)", data)
+SERVICES_BY_IDENTIFIER = _build_services_index()
+
+# Identifiers already reported as unknown, to warn only once.
+UNKNOWN_IDENTIFIERS = set()
+
+SERVICES_PATTERN = re.compile(r'^[(\[]?\s*(?P<NAMES>[\w.]+(\s*,\s*[\w.]+)*)?\s*,?\s*[)\]]?$')
+
+
+@lru_cache(maxsize=128)
+def parse_services(string_to_parse: str) -> Tuple[RaspberryService]:
+    """Returns a list of services from a string representation of a list of services, like
+    '(MENUS, AEMET)'. The results are cached, as most users share the same services.
+
+    Args:
+        string_to_parse (str): representation of the services.
+
+    Returns:
+        Tuple[RaspberryService]: services.
+
+    """
+    logger = logging.getLogger(__name__)
+
+    if not isinstance(string_to_parse, str):
+        return tuple()
+
+    match = SERVICES_PATTERN.search(string_to_parse.strip())
+    if match is None or match.group('NAMES') is None:
+        return tuple()
+
+    data = []
+    for name in match.group('NAMES').split(','):
+        name = name.strip().split('.')[-1]
+
+        try:
+            data.append(ServicesManager[name].value)
+        except KeyError:
+            warn(f"Something may have gone wrong (data={string_to_parse!r})",
+                 UnexpectedBehaviourWarning)
+            logger.warning("Something may have gone wrong (data=%r)", string_to_parse)
 
-        return tuple(data)
+    return tuple(data)
@@ -4,6 +4,7 @@ import json
 import logging
 import os
 import sqlite3
+import threading
 from dataclasses import dataclass, field
 from json import JSONDecodeError
 
@@ -26,13 +27,14 @@ class User:
     is_superuser: bool
     is_staff: bool
 
-    cronitems: list = field(init=False, hash=False, repr=False)
     is_banned: bool = field(init=False, repr=False)
 
     def __init__(self, username, launcher, is_active, is_superuser, is_staff, email, *services):
         self.username = username
         self.launcher = launcher
+        self._cronitems_generation = None
         self.cronitems = None
+        self.cronitems_loader = None
         self.is_active = bool(is_active)
         self.is_banned = not self.is_active
         self.email = email
@@ -49,8 +51,6 @@ class User:
                 else:
                     self.services = services
 
-        self.update_cronitems()
-
     def __hash__(self):
         o = (
             self.username, self.is_active, self.is_banned,
@@ -61,6 +61,27 @@ class User:
     def __eq__(self, other):
         return hash(self) == hash(other)
 
+    @property
+    def cronitems(self) -> tuple:
+        """Tasks created by user. They are loaded from the crontab the first time they are
+        needed, using cronitems_loader if it is set (to load the tasks of many users at once),
+        and loaded again if the crontab has been written by this process since then."""
+        if self._cronitems is None or \
+                self._cronitems_generation != CrontabManager.generation:
+            self._cronitems = None
+            if self.cronitems_loader is not None:
+                self.cronitems_loader()
+
+            if self._cronitems is None:
+                self.update_cronitems()
+
+        return self._cronitems
+
+    @cronitems.setter
+    def cronitems(self, value):
+        self._cronitems = value
+        self._cronitems_generation = CrontabManager.generation
+
     def update_cronitems(self):
         """Updates all tasks created by user."""
         self.cronitems = CrontabManager.list_by_user(self)
@@ -70,6 +91,16 @@ class User:
         CrontabManager.new(command, user, hour, minutes)
         self.update_cronitems()
 
+    def set_tasks(self, tasks):
+        """Replaces all the tasks of the user with a single read and write of the crontab.
+
+        Args:
+            tasks (Iterable[Tuple[str, int, int]]): tasks as tuples of command, hour and minutes.
+
+        """
+        CrontabManager.apply({self.username: tasks})
+        self.update_cronitems()
+
     def __str__(self):
         return self.username
 
@@ -77,6 +108,10 @@ class User:
 class UsersManager(list):
     """Clase para gestionar los usuarios."""
 
+    _shared = None
+    _shared_stamp = None
+    _shared_lock = threading.Lock()
+
     def __init__(self):
         super().__init__()
         self.logger = logging.getLogger(__name__)
@@ -84,10 +119,53 @@ class UsersManager(list):
         self.con = None
         self.cur = None
 
+        self.by_username = {}
+        self.by_chat_id = {}
+        self.by_email = {}
+
         self.load()
 
     def __contains__(self, item):
-        return item in self.usernames
+        return item in self.by_username
+
+    @classmethod
+    def shared(cls):
+        """Returns a UsersManager shared by the whole process. It is loaded again only if the
+        users database changes.
+
+        Its users (also returned by get_by_username, get_by_telegram_id and get_by_email) are
+        shared by the whole process, so they must be treated as read-only. To modify a user,
+        use the users of a private UsersManager().
+        """
+
+        path = RpiDns.get('sqlite.django')
+
+        with cls._shared_lock:
+            try:
+                stat = os.stat(path)
+                stamp = (path, stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                stamp = None
+
+            if cls._shared is None or stamp is None or stamp != cls._shared_stamp:
+                cls._shared = cls()
+                cls._shared_stamp = stamp
+
+            return cls._shared
+
+    def index(self):
+        """Builds the indexes by username, telegram chat id and email."""
+
+        self.by_username = {}
+        self.by_chat_id = {}
+        self.by_email = {}
+
+        for user in self:
+            self.by_username.setdefault(user.username, user)
+            self.by_email.setdefault(user.email, user)
+
+            if isinstance(user.launcher, TelegramLauncher):
+                self.by_chat_id.setdefault(user.launcher.chat_id, user)
 
     def __str__(self):
         return '\n'.join([repr(e) for e in self])
@@ -103,19 +181,36 @@ class UsersManager(list):
         return result
 
     def save_launcher(self, username):
-        for user in self:
-            if user.username == username:
-                self.con = sqlite3.connect(self.path)
-                self.cur = self.con.cursor()
-
-                data = (json.dumps(user.launcher.to_json()), user.username)
-                self.cur.execute('update usuarios_usuario set launcher=? where username=?', data)
-                self.con.commit()
-                self.con.close()
-                self.logger.debug(f'Saved launcher for {username!r}')
-                return True
-        self.logger.debug(f'Could not save launcher for {username!r}')
-        return False
+        """Saves the launcher of a user in the database.
+
+        Args:
+            username (Union[User, str]): user whose launcher is saved. If it is a User, its
+                launcher is saved; if it is a username, the launcher of the user of this
+                manager is saved.
+
+        Returns:
+            bool: True if the launcher was saved, False if the user does not exist.
+
+        """
+        if isinstance(username, User):
+            user = username
+        else:
+            try:
+                user = self.by_username[username]
+            except KeyError:
+                self.logger.debug(f'Could not save launcher for {username!r}')
+                return False
+        username = user.username
+
+        self.con = sqlite3.connect(self.path)
+        self.cur = self.con.cursor()
+
+        data = (json.dumps(user.launcher.to_json()), user.username)
+        self.cur.execute('update usuarios_usuario set launcher=? where username=?', data)
+        self.con.commit()
+        self.con.close()
+        self.logger.debug(f'Saved launcher for {username!r}')
+        return True
 
     def load(self):
         """Carga todos los usuarios."""
@@ -172,32 +267,51 @@ class UsersManager(list):
             else:
                 launcher = InvalidLauncher()
 
-            self.append(
-                User(username, launcher, is_active, is_superuser, is_staff, email, services))
+            user = User(username, launcher, is_active, is_superuser, is_staff, email, services)
+            user.cronitems_loader = self.load_cronitems
+            self.append(user)
+
+        self.index()
 
         self.logger.debug('Users loaded')
         return self
 
-    @staticmethod
-    def get_by_username(username) -> User:
-        self = UsersManager.__new__(UsersManager)
-        self.__init__()
+    def load_cronitems(self):
+        """Loads the tasks of every user with a single read of the crontab."""
+
+        self.logger.debug('Loading cronitems')
+        cronitems = CrontabManager.group_by_user()
 
         for user in self:
-            if user.username == username:
-                return user
-        self.logger.critical(f'Unknown username: {username!r}')
-        raise UserNotFoundError(f'Unknown username: {username!r}')
+            user.cronitems = cronitems.get(user.username, ())
+
+    @classmethod
+    def get_by_username(cls, username) -> User:
+        self = cls.shared()
+
+        try:
+            return self.by_username[username]
+        except (KeyError, TypeError):
+            self.logger.critical(f'Unknown username: {username!r}')
+            raise UserNotFoundError(f'Unknown username: {username!r}')
 
-    @staticmethod
-    def get_by_telegram_id(chat_id) -> User:
-        self = UsersManager.__new__(UsersManager)
-        self.__init__()
+    @classmethod
+    def get_by_telegram_id(cls, chat_id) -> User:
+        self = cls.shared()
 
         chat_id = int(chat_id)
-        for user in self:
-            if isinstance(user.launcher, TelegramLauncher):
-                if user.launcher.chat_id == chat_id:
-                    return user
-        self.logger.critical(f'Unknown chat_id: {chat_id!r}')
-        raise UserNotFoundError(f'Unknown chat_id: {chat_id!r}')
+        try:
+            return self.by_chat_id[chat_id]
+        except KeyError:
+            self.logger.critical(f'Unknown chat_id: {chat_id!r}')
+            raise UserNotFoundError(f'Unknown chat_id: {chat_id!r}')
+
+    @classmethod
+    def get_by_email(cls, email) -> User:
+        self = cls.shared()
+
+        try:
+            return self.by_email[email]
+        except (KeyError, TypeError):
+            self.logger.critical(f'Unknown email: {email!r}')
+            raise UserNotFoundError(f'Unknown email: {email!r}')
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""Durable queue of outgoing notifications."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import List
+
+from rpi.dns import RpiDns
+
+
+@dataclass
+class QueuedNotification:
+    """Notification stored in the queue."""
+    id: int
+    username: str
+    title: str
+    message: str
+    attempts: int
+    last_error: str = None
+    parts: list = None
+
+    @classmethod
+    def from_row(cls, row):
+        """Creates the notification from a row of the notifications table (id, username,
+        title, message, attempts, last_error, parts)."""
+        *fields, parts = row
+        if parts is not None:
+            parts = [tuple(part) for part in json.loads(parts)]
+        return cls(*fields, parts)
+
+    @property
+    def messages(self) -> list:
+        """Titles and messages coalesced in the notification, in order."""
+        if self.parts is None:
+            return [(self.title, self.message)]
+        return self.parts
+
+
+class NotificationQueue:
+    """Queue of notifications stored in a sqlite database, so producers do not wait for the
+    network and notifications are not lost if the delivery fails.
+
+    Notifications of the same user are delivered in order: only the oldest pending
+    notification of each user can be claimed. A claimed notification is leased for LEASE
+    seconds; if it is not acknowledged or retried before, it is claimed again. After
+    MAX_ATTEMPTS failed deliveries it is moved to the dead letters.
+
+    Notifications queued with a digest window wait that window before being delivered, and the
+    notifications queued for the same user meanwhile are merged into them, so the notifications
+    of many processes (cron scripts) are delivered together.
+    """
+
+    MAX_ATTEMPTS = 8
+    LEASE = 300
+    BACKOFF = 30
+    MAX_BACKOFF = 3600
+
+    def __init__(self, path=None):
+        self.logger = logging.getLogger(__name__)
+        self.path = path or os.path.join(os.path.dirname(RpiDns.PATH), 'notifications.sqlite')
+        self.lock = threading.Lock()
+
+        with self.transaction() as con:
+            con.execute("""CREATE TABLE IF NOT EXISTS "notifications" (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        username VARCHAR NOT NULL,
+                        title VARCHAR NOT NULL,
+                        message VARCHAR NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        next_attempt REAL NOT NULL,
+                        dead INTEGER NOT NULL DEFAULT 0,
+                        last_error VARCHAR,
+                        parts VARCHAR,
+                        digest_until REAL)""")
+            con.execute('CREATE INDEX IF NOT EXISTS "pending" '
+                        'ON notifications(dead, username, id)')
+
+            # Queues created before the digests.
+            columns = {row[1] for row in con.execute('PRAGMA table_info(notifications)')}
+            for column, column_type in (('parts', 'VARCHAR'), ('digest_until', 'REAL')):
+                if column not in columns:
+                    con.execute(f'ALTER TABLE notifications ADD COLUMN {column} {column_type}')
+
+    @contextmanager
+    def transaction(self):
+        """Yields a connection to the queue database in an immediate transaction, commits and
+        closes it."""
+        with self.lock:
+            con = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            try:
+                con.execute('BEGIN IMMEDIATE')
+                try:
+                    yield con
+                except BaseException:
+                    con.execute('ROLLBACK')
+                    raise
+                con.execute('COMMIT')
+            finally:
+                con.close()
+
+    def __len__(self):
+        with self.transaction() as con:
+            return con.execute('SELECT COUNT(*) FROM notifications WHERE dead=0').fetchone()[0]
+
+    def enqueue(self, usernames, title: str, message: str, digest: float = 0) -> List[int]:
+        """Adds a notification for some users.
+
+        Args:
+            usernames (Iterable[str]): usernames of the destinations.
+            title (str): title of the notification.
+            message (str): message of the notification.
+            digest (float): if not 0, the notification is delivered after digest seconds,
+                together with the notifications queued for the same user in that time. If the
+                last notification of a user is still waiting for its digest window, the
+                notification is merged into it.
+
+        Returns:
+            List[int]: ids of the notifications queued, one per user. The id of a
+                notification merged is the one of the notification it was merged into.
+
+        """
+        now = time.time()
+        ids = []
+
+        with self.transaction() as con:
+            for username in usernames:
+                if digest:
+                    row = con.execute(
+                        'SELECT id, title, message, parts FROM notifications WHERE id=('
+                        'SELECT MAX(id) FROM notifications WHERE username=? AND dead=0) '
+                        'AND digest_until>?', (username, now)).fetchone()
+
+                    if row is not None:
+                        id_, first_title, first_message, parts = row
+                        parts = json.loads(parts) if parts else [[first_title, first_message]]
+                        parts.append([title, message])
+                        con.execute('UPDATE notifications SET parts=? WHERE id=?',
+                                    (json.dumps(parts), id_))
+                        ids.append(id_)
+                        continue
+
+                cursor = con.execute(
+                    'INSERT INTO notifications(username, title, message, next_attempt, '
+                    'digest_until) VALUES(?, ?, ?, ?, ?)',
+                    (username, title, message, now + digest, now + digest if digest else None))
+                ids.append(cursor.lastrowid)
+
+        self.logger.debug('Queued notification %r for %d users', title, len(ids))
+        return ids
+
+    def claim(self, batch_size=50) -> List[QueuedNotification]:
+        """Returns notifications ready to be delivered, leasing them.
+
+        Args:
+            batch_size (int): maximum number of notifications returned. At most one
+                notification per user is returned.
+
+        Returns:
+            List[QueuedNotification]: notifications to deliver.
+
+        """
+        now = time.time()
+
+        with self.transaction() as con:
+            rows = con.execute(
+                'SELECT id, username, title, message, attempts, last_error, parts '
+                'FROM notifications WHERE id IN '
+                '(SELECT MIN(id) FROM notifications WHERE dead=0 GROUP BY username) '
+                'AND next_attempt<=? ORDER BY id LIMIT ?', (now, batch_size)).fetchall()
+
+            con.executemany('UPDATE notifications SET next_attempt=? WHERE id=?',
+                            [(now + self.LEASE, row[0]) for row in rows])
+
+        return [QueuedNotification.from_row(row) for row in rows]
+
+    def ack(self, notification_id: int):
+        """Removes a notification delivered."""
+        with self.transaction() as con:
+            con.execute('DELETE FROM notifications WHERE id=?', (notification_id,))
+
+    def backoff_time(self, attempts: int) -> float:
+        """Returns the seconds to wait before delivering again a notification that failed
+        attempts times."""
+        return min(self.MAX_BACKOFF, self.BACKOFF * 2 ** (attempts - 1))
+
+    def retry(self, notification: QueuedNotification, error) -> bool:
+        """Schedules a notification whose delivery failed to be delivered again, or moves it
+        to the dead letters if it has failed MAX_ATTEMPTS times.
+
+        Args:
+            notification (QueuedNotification): notification that failed.
+            error (Exception): error raised delivering it.
+
+        Returns:
+            bool: True if it will be retried, False if it is now a dead letter.
+
+        """
+        attempts = notification.attempts + 1
+        dead = attempts >= self.MAX_ATTEMPTS
+
+        with self.transaction() as con:
+            con.execute('UPDATE notifications SET attempts=?, next_attempt=?, dead=?, '
+                        'last_error=? WHERE id=?',
+                        (attempts, time.time() + self.backoff_time(attempts), int(dead),
+                         f'{type(error).__name__}: {error}', notification.id))
+
+        if dead:
+            self.logger.error('Notification %d to %r is a dead letter after %d attempts: %r',
+                              notification.id, notification.username, attempts, error)
+        else:
+            self.logger.warning('Notification %d to %r failed (%d attempts): %r',
+                                notification.id, notification.username, attempts, error)
+
+        return not dead
+
+    def dead_letters(self) -> List[QueuedNotification]:
+        """Returns the notifications that could not be delivered."""
+        with self.transaction() as con:
+            rows = con.execute('SELECT id, username, title, message, attempts, last_error, '
+                               'parts FROM notifications WHERE dead=1 ORDER BY id').fetchall()
+
+        return [QueuedNotification.from_row(row) for row in rows]
+
+    def requeue_dead_letters(self) -> int:
+        """Queues again the dead letters.
+
+        Returns:
+            int: number of notifications queued again.
+
+        """
+        with self.transaction() as con:
+            cursor = con.execute('UPDATE notifications SET dead=0, attempts=0, next_attempt=? '
+                                 'WHERE dead=1', (time.time(),))
+            return cursor.rowcount
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""Reusable authenticated SMTP session."""
+
+import atexit
+import logging
+import smtplib
+import threading
+import time
+
+
+class SmtpSession:
+    """SMTP connection kept open between emails, so sending many emails needs a single
+    STARTTLS handshake and login.
+
+    If the connection has been idle for more than idle_timeout seconds (the server would have
+    dropped it anyway), it is opened again before sending the next email. If the server closes
+    the connection, it is opened again and the email is sent again once.
+    """
+
+    HOST = 'smtp.gmail.com'
+    PORT = 587
+    IDLE_TIMEOUT = 60
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, username, password, host=None, port=None, starttls=True,
+                 idle_timeout=None):
+        self.logger = logging.getLogger(__name__)
+        self.username = username
+        self.password = password
+        self.host = host or self.HOST
+        self.port = port or self.PORT
+        self.starttls = starttls
+        self.idle_timeout = idle_timeout or self.IDLE_TIMEOUT
+
+        self.server = None
+        self.last_used = 0
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @classmethod
+    def shared(cls):
+        """Returns the session of the mail account of the system, shared by the whole process.
+        It is closed when the process exits."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                from rpi.managers.keys_manager import KeysManager
+                password, username = KeysManager.get_many('mail_password', 'mail_username')
+                cls._shared = cls(username, password)
+                atexit.register(cls._shared.close)
+            return cls._shared
+
+    def connect(self) -> smtplib.SMTP:
+        """Returns the connection, opening it if it is closed or has been idle too long."""
+        with self.lock:
+            if self.server is not None and \
+                    time.monotonic() - self.last_used > self.idle_timeout:
+                self.logger.debug('SMTP connection idle for too long, reconnecting')
+                self.close()
+
+            if self.server is None:
+                self.logger.debug('Connecting to %s:%s', self.host, self.port)
+                server = smtplib.SMTP(self.host, self.port)
+                try:
+                    if self.starttls:
+                        server.starttls()
+                    if self.password is not None:
+                        server.login(self.username, self.password)
+                except BaseException:
+                    server.close()
+                    raise
+                self.server = server
+
+            self.last_used = time.monotonic()
+            return self.server
+
+    def close(self):
+        """Closes the connection, if it is open."""
+        with self.lock:
+            if self.server is None:
+                return
+
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                self.server.close()
+            self.server = None
+
+    def send(self, msg):
+        """Sends an email.
+
+        Args:
+            msg (email.message.Message): email, with the To header set.
+
+        """
+        with self.lock:
+            try:
+                self.connect().sendmail(self.username, msg['To'], msg.as_string())
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self.logger.warning('SMTP connection lost, reconnecting')
+                if self.server is not None:
+                    self.server.close()
+                    self.server = None
+                self.connect().sendmail(self.username, msg['To'], msg.as_string())
+
+            self.last_used = time.monotonic()
+
+    def send_many(self, messages) -> list:
+        """Sends many emails over the same connection.
+
+        Args:
+            messages (Iterable[email.message.Message]): emails, with the To header set.
+
+        Returns:
+            list: True for each email sent, or the exception raised sending it.
+
+        """
+        results = []
+
+        with self.lock:
+            for msg in messages:
+                try:
+                    self.send(msg)
+                    results.append(True)
+                except (smtplib.SMTPException, OSError) as exc:
+                    self.logger.error('Error sending email to %r: %r', msg['To'], exc)
+                    results.append(exc)
+
+        return results
@@ -92,8 +92,7 @@ class WeatherRecordsManager:
         self.logger.debug('Processing aemet web - %r', url)
 
         try:
-            with Downloader() as downloader:
-                principal_page = downloader.get(url)
+            principal_page = Downloader.shared().get(url, cached=True)
         except DownloaderError:
             self.logger.critical('Aemet download error')
             return None
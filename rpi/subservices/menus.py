@@ -12,7 +12,7 @@ from bs4 import BeautifulSoup as Soup
 
 from rpi.custom_logging import configure_logging
 from rpi.dns import RpiDns
-from rpi.downloader import Downloader
+from rpi.downloader import Downloader, AsyncDownloader
 from rpi.exceptions import InvalidMonthError, InvalidDayError, DownloaderError
 
 configure_logging(called_from=__file__, use_logs_folder=True)
@@ -287,6 +287,9 @@ class Menu:
 class MenusManager:
     """Manages a list of menus."""
 
+    # Maximum number of menus webs downloaded at the same time.
+    CONCURRENCY = 8
+
     def __init__(self, url=None):
         self.logger = logging.getLogger(__name__)
         self.logger.debug('Starting menus manager')
@@ -295,7 +298,7 @@ class MenusManager:
         self.updated = False
         self.list = []
         self.opcodes = []
-        self.downloader = Downloader()
+        self.downloader = Downloader.shared()
         self.database_manager = MenusDatabaseManager()
 
         # Patterns:
@@ -516,7 +519,7 @@ class MenusManager:
         self.logger.debug('Generating opcodes')
 
         try:
-            html = self.downloader.get(url)
+            html = self.downloader.get(url, cached=True)
         except DownloaderError:
             return -1
 
@@ -529,18 +532,15 @@ class MenusManager:
             text.append(container.text)
             urls.append(container.a['href'])
 
-        hilos = []
-        i = 1
-        for url in urls:
-            if url in self.database_manager:
-                continue
-            hilo = threading.Thread(name=str(i), target=self.procesar_url_menus, args=(url,))
-            hilo.start()
-            hilos.append(hilo)
-            i += 1
+        urls = [url for url in urls if url not in self.database_manager]
+        responses = AsyncDownloader.download_many(urls, concurrency=self.CONCURRENCY,
+                                                  downloader=self.downloader)
 
-        for hilo in hilos:
-            hilo.join()
+        for url, response in zip(urls, responses):
+            try:
+                self.procesar_url_menus(url, response)
+            except Exception as exc:
+                self.logger.exception('Error processing %r: %r', url, exc)
 
         for enlace in self.links_to_save:
             self.database_manager.save_link(enlace)
@@ -551,11 +551,24 @@ class MenusManager:
         with self.opcodes_lock:
             self.opcodes.append(anything)
 
-    def procesar_url_menus(self, url):
+    def procesar_url_menus(self, url, html=None):
+        """Extracts the opcodes of a menus web.
+
+        Args:
+            url (str): url of the web.
+            html (Union[requests.Response, Exception]): response of the url, if it has already
+                been downloaded, or the exception raised downloading it.
+
+        """
         self.logger.debug('Processing web %r', url)
 
+        if isinstance(html, Exception):
+            self.logger.error('Skipped: %r (%r)', url, html)
+            return
+
         try:
-            html = self.downloader.get(url)
+            if html is None:
+                html = self.downloader.get(url)
         except DownloaderError:
             self.logger.error('Skipped: %r', url)
             return
@@ -1,13 +1,21 @@
 import os
 import random
 import string
+import threading
+import time
 
 import pytest
+from telegram.error import BadRequest
 
 from rpi import operating_system
 from rpi.connections import Connections
+from rpi.downloader import Downloader
 from rpi.exceptions import NeccessaryArgumentError, UserNotFoundError, InvalidMailAddressError, \
-    SpreadsheetNotFoundError, SheetNotFoundError
+    SpreadsheetNotFoundError, SheetNotFoundError, DownloaderError
+from rpi.launcher import IftttLauncher, TelegramLauncher, TelegramDispatcher, BaseLauncher
+from rpi.managers.services_manager import ServicesManager
+from rpi.managers.users_manager import UsersManager
+from rpi.notification_queue import NotificationQueue
 
 
 def test_connections_disable():
@@ -35,6 +43,190 @@ def test_notification():
     assert Connections.notify('test_title', 'test_message', 'test', force=True) is True
 
 
+class FakeLauncher(BaseLauncher):
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def __init__(self, fail=None):
+        self.fail = fail
+
+    def fire(self, title, message, digest=True):
+        self.digest = digest
+        self.fired = (title, message)
+
+        with FakeLauncher.lock:
+            FakeLauncher.active += 1
+            FakeLauncher.peak = max(FakeLauncher.peak, FakeLauncher.active)
+
+        time.sleep(0.01)
+
+        with FakeLauncher.lock:
+            FakeLauncher.active -= 1
+
+        if self.fail is not None:
+            raise self.fail
+
+
+class FakeUser:
+    def __init__(self, username, launcher, is_active=True, services=()):
+        self.username = username
+        self.launcher = launcher
+        self.is_active = is_active
+        self.services = services
+
+
+def test_dispatch(monkeypatch):
+    monkeypatch.setitem(Connections.LAUNCHER_CONCURRENCY, 'FakeLauncher', 3)
+    monkeypatch.setattr(Connections, '_executors', {})
+    monkeypatch.setattr(FakeLauncher, 'active', 0)
+    monkeypatch.setattr(FakeLauncher, 'peak', 0)
+    connections = Connections()
+    connections.DISABLE = False
+
+    users = [FakeUser(f'user{x}', FakeLauncher()) for x in range(10)]
+    users.append(FakeUser('failing', FakeLauncher(DownloaderError('max retries failed.'))))
+    users.append(FakeUser('blocked', FakeLauncher(BadRequest('Forbidden: bot was blocked'))))
+    users.append(FakeUser('banned', FakeLauncher(), is_active=False))
+
+    results = connections.dispatch(users, 'test_title', 'test_message')
+
+    assert FakeLauncher.peak == 3
+    assert all(results[f'user{x}'] is True for x in range(10))
+    assert isinstance(results['failing'], DownloaderError)
+    assert isinstance(results['blocked'], BadRequest)
+    assert results['banned'] is False
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.calls = []
+
+    def send_many(self, messages):
+        messages = list(messages)
+        self.calls.append(messages)
+
+        results = {}
+        for chat_id, _ in messages:
+            result = BadRequest('Chat not found') if chat_id == 0 else True
+            results.setdefault(chat_id, []).append(result)
+        return results
+
+
+def test_dispatch_telegram(monkeypatch):
+    dispatcher = FakeDispatcher()
+    monkeypatch.setattr(TelegramDispatcher, 'shared', classmethod(lambda cls: dispatcher))
+    connections = Connections()
+    connections.DISABLE = False
+
+    users = [FakeUser('telegram1', TelegramLauncher(1)),
+             FakeUser('telegram2', TelegramLauncher(2)),
+             FakeUser('unknown', TelegramLauncher(0)),
+             FakeUser('banned', TelegramLauncher(3), is_active=False),
+             FakeUser('other', FakeLauncher())]
+
+    results = connections.dispatch(users, 'test_title', 'test_message')
+
+    assert dispatcher.calls == [[(1, 'test_title:\ntest_message'), (2, 'test_title:\ntest_message'),
+                                 (0, 'test_title:\ntest_message')]]
+    assert list(results) == ['telegram1', 'telegram2', 'unknown', 'banned', 'other']
+    assert results['telegram1'] is True and results['telegram2'] is True
+    assert isinstance(results['unknown'], BadRequest)
+    assert results['banned'] is False
+    assert results['other'] is True
+
+
+def test_deliver_queued(tmp_path, monkeypatch):
+    class FakeUsersManager:
+        by_username = {
+            'ok': FakeUser('ok', FakeLauncher()),
+            'blocked': FakeUser('blocked', FakeLauncher(BadRequest('Forbidden: bot was blocked')))
+        }
+
+    monkeypatch.setattr(UsersManager, 'shared', classmethod(lambda cls: FakeUsersManager()))
+    monkeypatch.setattr(Connections, 'DISABLE', False)
+
+    queue = NotificationQueue(str(tmp_path / 'notifications.sqlite'))
+    queue.LEASE = 0
+    queue.BACKOFF = 0
+    queue.MAX_ATTEMPTS = 2
+    queue.enqueue(['blocked', 'ok'], 'test_title', 'test_message1')
+    queue.enqueue(['ok'], 'test_title', 'test_message2')
+
+    assert Connections.deliver_queued(queue) == (1, 1, 0)
+    assert Connections.deliver_queued(queue) == (1, 0, 1)
+    assert Connections.deliver_queued(queue) == (0, 0, 0)
+
+    assert len(queue) == 0
+    assert FakeUsersManager.by_username['ok'].launcher.digest is False
+    assert [x.username for x in queue.dead_letters()] == ['blocked']
+    assert 'bot was blocked' in queue.dead_letters()[0].last_error
+
+
+def test_deliver_queued_unreachable(tmp_path, monkeypatch):
+    launcher = IftttLauncher('http://localhost:1/', Downloader(retries=2, backoff=0.01))
+
+    class FakeUsersManager:
+        by_username = {'ifttt': FakeUser('ifttt', launcher)}
+
+    monkeypatch.setattr(UsersManager, 'shared', classmethod(lambda cls: FakeUsersManager()))
+    monkeypatch.setattr(Connections, 'DISABLE', False)
+
+    queue = NotificationQueue(str(tmp_path / 'notifications.sqlite'))
+    queue.LEASE = 0
+    queue.BACKOFF = 0
+    queue.MAX_ATTEMPTS = 2
+    queue.enqueue(['ifttt'], 'test_title', 'test_message')
+
+    assert Connections.deliver_queued(queue) == (0, 1, 0)
+    assert Connections.deliver_queued(queue) == (0, 0, 1)
+
+    assert [x.username for x in queue.dead_letters()] == ['ifttt']
+    assert 'DownloaderError' in queue.dead_letters()[0].last_error
+
+
+def test_deliver_queued_digest(tmp_path, monkeypatch):
+    class FakeUsersManager:
+        by_username = {'ok': FakeUser('ok', FakeLauncher())}
+
+    monkeypatch.setattr(UsersManager, 'shared', classmethod(lambda cls: FakeUsersManager()))
+    monkeypatch.setattr(Connections, 'DISABLE', False)
+
+    queue = NotificationQueue(str(tmp_path / 'notifications.sqlite'))
+    queue.enqueue(['ok'], 'Backup', 'done', digest=0.1)
+    queue.enqueue(['ok'], 'Ngrok', 'started', digest=0.1)
+    assert Connections.deliver_queued(queue) == (0, 0, 0)
+
+    time.sleep(0.15)
+    assert Connections.deliver_queued(queue) == (1, 0, 0)
+    assert FakeUsersManager.by_username['ok'].launcher.fired == (
+        '2 notificaciones', 'Backup: done\n\nNgrok: started')
+
+
+def test_notify_digest_service(tmp_path, monkeypatch):
+    user = FakeUser('log', FakeLauncher(), services=(ServicesManager.LOG.value,))
+
+    class FakeUsersManager(list):
+        usernames = ['log']
+        by_username = {'log': user}
+
+        def get_by_username(self, username):
+            return self.by_username[username]
+
+    queue = NotificationQueue(str(tmp_path / 'notifications.sqlite'))
+    monkeypatch.setattr(UsersManager, 'shared', classmethod(lambda cls: FakeUsersManager([user])))
+    monkeypatch.setattr('rpi.connections.NotificationQueue', lambda: queue)
+
+    for title in ('Backup', 'Ngrok', 'Reboot'):
+        details = Connections.notify(title, 'done', 'log', file='/home/pi/scripts/backup.py',
+                                     details=True)
+        assert details == {'log': 1}
+
+    assert len(queue) == 1
+    assert queue.claim() == []
+    assert not hasattr(user.launcher, 'fired')
+
+
 def test_mail():
     with pytest.raises(InvalidMailAddressError, match="'test_destination' is not a valid email"):
         Connections.send_email('test_destination', 'test_subject', 'test_message')
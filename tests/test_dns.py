@@ -1,11 +1,23 @@
 import os
+import sqlite3
+import threading
 
 import pytest
 
-from rpi.dns import RpiDns
+from rpi.dns import RpiDns, FuzzyAliasIndex
 from rpi.exceptions import DnsError, PlatformError
 
 
+class TestFuzzyAliasIndex:
+    def test_search(self):
+        index = FuzzyAliasIndex(['linux.sqlite.menus_resi', 'linux.sqlite.django'])
+
+        assert index.search('linux.sqlite.menus_res') == ('linux.sqlite.menus_resi', 44 / 45)
+        assert index.search('LINUX.SQLITE.DJANGOO')[0] == 'linux.sqlite.django'
+        assert index.search('linux.folder.logs')[0] is None
+        assert 'linux.sqlite.menus_res' in index.memo
+
+
 class TestDns:
     def test_dns_add_one(self):
         assert RpiDns.len() >= 0
@@ -21,6 +33,55 @@ class TestDns:
         with pytest.raises(PlatformError, match='Invalid platform'):
             RpiDns.new_alias('rpi.text.test_one_independendant', 'D:/')
 
+    def test_dns_cache(self):
+        assert RpiDns.get('text.test_one') == 'D:/test/dns'
+        assert RpiDns.table() is RpiDns.table()
+
+        RpiDns.invalidate()
+        assert RpiDns.get('text.test_one') == 'D:/test/dns'
+
+    def test_dns_persistent(self):
+        RpiDns.set_persistent()
+
+        try:
+            assert RpiDns.get('text.test_one') == 'D:/test/dns'
+            RpiDns.new_alias('text.test-persistent', 'D:/test/dns/persistent')
+            assert RpiDns.get('text.test-persistent') == 'D:/test/dns/persistent'
+            RpiDns.del_alias(RpiDns.extend_alias('text.test-persistent'))
+            assert RpiDns.extend_alias('text.test-persistent') not in RpiDns.alias()
+        finally:
+            RpiDns.set_persistent(False)
+
+    def test_dns_persistent_locked(self, monkeypatch):
+        RpiDns.set_persistent()
+        monkeypatch.setattr(RpiDns, 'TIMEOUT', 0.1)
+        RpiDns.disconnect()
+        RpiDns.table()
+
+        locker = sqlite3.connect(RpiDns.PATH, isolation_level=None)
+        locker.execute('BEGIN EXCLUSIVE')
+
+        try:
+            with pytest.raises(sqlite3.OperationalError, match='locked'):
+                RpiDns.new_alias('text.test-locked', 'D:/test/dns/locked')
+        finally:
+            locker.execute('ROLLBACK')
+            locker.close()
+
+        released = []
+
+        def acquire():
+            if RpiDns._connection_lock.acquire(timeout=1):
+                released.append(True)
+                RpiDns._connection_lock.release()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        thread.join()
+        RpiDns.set_persistent(False)
+
+        assert released == [True]
+
     def test_dns_add_multiple(self):
         with pytest.raises(DnsError, match='For dual alias, 2 subalias must be given'):
             RpiDns.new_dual_alias('only-one-alias', 'D:/test/dns/dual',
@@ -29,6 +90,25 @@ class TestDns:
         RpiDns.new_dual_alias('text.test-multiple', 'D:/test/dns/dual-success',
                               '/home/test/dns/dual-success')
 
+    def test_dns_bulk(self):
+        aliases = {'text.test-bulk-1': 'D:/test/dns/bulk-1', 'text.test-bulk-2': 'D:/test/dns/bulk-2'}
+        assert RpiDns.bulk_import(aliases) == 2
+
+        with pytest.raises(DnsError, match='already exists'):
+            RpiDns.bulk_import({'text.test-bulk-3': 'D:/test/dns/bulk-3',
+                                'text.test-bulk-1': 'D:/test/dns/bulk-1'})
+
+        assert RpiDns.resolve_many('text.test-bulk-1', 'text.test-bulk-2') == tuple(
+            aliases.values())
+        assert RpiDns.resolve_many(['text.test-bulk-2']) == ('D:/test/dns/bulk-2',)
+
+        exported = dict(RpiDns.bulk_export())
+        assert exported[RpiDns.extend_alias('text.test-bulk-1')] == 'D:/test/dns/bulk-1'
+        assert RpiDns.extend_alias('text.test-bulk-3') not in exported
+
+        RpiDns.del_alias(RpiDns.extend_alias('text.test-bulk-1'))
+        RpiDns.del_alias(RpiDns.extend_alias('text.test-bulk-2'))
+
     def test_dns_delete(self):
         with pytest.raises(DnsError, match='linux'):
             RpiDns.del_alias('text.test_one', error=False)
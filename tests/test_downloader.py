@@ -3,10 +3,14 @@
 #     def get(self, url, **kwargs):
 #     def post(self, url, data=None, json=None, **kwargs):
 import os
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
 
 import pytest
 
-from rpi.downloader import Downloader
+from rpi.downloader import Downloader, RetryBudget, ResponseCache, AsyncDownloader, \
+    DownloaderMetrics
+from rpi.exceptions import DownloaderError
 
 TEST_SERVER = 'http://httpbin.org/'
 
@@ -24,5 +28,114 @@ def test_post(downloader):
     assert downloader.post(TEST_SERVER + 'post', data={'peter': 'pan'}).status_code == 200
 
 
+def test_shared():
+    assert Downloader.shared() is Downloader.shared()
+
+
+def test_backoff_time():
+    downloader = Downloader(backoff=1, max_backoff=8)
+
+    for attempt, maximum in enumerate((1, 2, 4, 8, 8)):
+        assert maximum / 2 <= downloader.backoff_time(attempt) <= maximum
+
+
+def test_retry_budget():
+    budget = RetryBudget(retries=2, window=60)
+
+    assert budget.consume('a.com') is True
+    assert budget.consume('a.com') is True
+    assert budget.consume('a.com') is False
+    assert budget.consume('b.com') is True
+
+
+# noinspection PyPep8Naming
+class EtagServer(BaseHTTPRequestHandler):
+    requests_received = 0
+
+    def log_message(self, _format, *args):
+        pass
+
+    def do_GET(self):
+        EtagServer.requests_received += 1
+
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = ('body of ' + self.path).encode()
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def etag_server():
+    server = HTTPServer(('localhost', 0), EtagServer)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://localhost:{server.server_port}/'
+    server.shutdown()
+    server.server_close()
+
+
+def test_cached_get(etag_server, tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), max_size=25)
+    downloader = Downloader(cache=cache)
+
+    first = downloader.get(etag_server + 'a', cached=True)
+    second = downloader.get(etag_server + 'a', cached=True)
+
+    assert first.from_cache is False
+    assert second.from_cache is True
+    assert second.status_code == 200
+    assert second.text == first.text == 'body of /a'
+
+    downloader.get(etag_server + 'b', cached=True)
+    downloader.get(etag_server + 'c', cached=True)
+    assert cache.lookup(etag_server + 'a') is None
+    assert cache.lookup(etag_server + 'c') is not None
+
+
+def test_download_many(etag_server):
+    urls = [etag_server + str(number) for number in range(12)]
+    responses = AsyncDownloader.download_many(urls + ['http://localhost:1/'], concurrency=4,
+                                              downloader=Downloader(retries=1))
+
+    assert [response.text for response in responses[:-1]] == [f'body of /{x}' for x in range(12)]
+    assert isinstance(responses[-1], DownloaderError)
+
+
+def test_metrics(tmp_path):
+    metrics = DownloaderMetrics(str(tmp_path / 'metrics.sqlite'))
+    metrics.record('GET', 'http://a.com/1', 200, 0.05, 100, 0)
+    metrics.record('GET', 'http://a.com/2', None, 3, 0, 2)
+    metrics.save()
+    metrics.record('POST', 'http://b.com/', 404, 50, 10, 1)
+
+    summary = metrics.summary()
+    assert summary['a.com']['requests'] == 2
+    assert summary['a.com']['errors'] == 1
+    assert summary['a.com']['retries'] == 2
+    assert summary['a.com']['bytes'] == 100
+    assert summary['a.com']['statuses'] == {'200': 1, 'error': 1}
+    assert summary['a.com']['latency'] == {'<=0.1s': 1, '<=5s': 1}
+    assert summary['b.com']['latency'] == {'>30s': 1}
+    assert 'a.com: 2 requests, 1 errors' in metrics.format_summary()
+
+    metrics.reset()
+    assert metrics.summary() == {}
+
+
+def test_metrics_save_error(tmp_path, caplog):
+    metrics = DownloaderMetrics(str(tmp_path / 'missing' / 'metrics.sqlite'))
+    metrics.record('GET', 'http://a.com/1', 200, 0.05, 100, 0)
+    metrics.save()
+
+    assert 'Could not save downloader metrics' in caplog.text
+
+
 if __name__ == '__main__':
     pytest.main([os.path.basename(__file__), '-v'])
@@ -1,12 +1,15 @@
 import os
 import threading
+import time
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import unquote
 
 import pytest
-from telegram.error import BadRequest
+from telegram.error import BadRequest, RetryAfter
 
-from rpi.launcher import InvalidLauncher, IftttLauncher, TelegramLauncher, NotifyRunLauncher
+from rpi.launcher import InvalidLauncher, IftttLauncher, TelegramLauncher, NotifyRunLauncher, \
+    TokenBucket, TelegramDispatcher, BaseLauncher
+from rpi.managers.config_manager import ConfigManager
 
 
 # noinspection PyPep8Naming
@@ -49,8 +52,8 @@ class MyServer(BaseHTTPRequestHandler):
 
         self.send_response(code)
         self.send_header('Content-type', 'text/plain')
-        self.wfile.write('Done'.encode())
         self.end_headers()
+        self.wfile.write('Done'.encode())
 
 
 def get_server():
@@ -100,5 +103,80 @@ class TestLaunchers:
         notify_run_launcher.fire('test_title', 'test_message')
 
 
+def test_token_bucket():
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = time.monotonic()
+
+    for _ in range(6):
+        bucket.acquire()
+
+    assert 0.15 <= time.monotonic() - start < 0.5
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self.limited = 1
+
+    def send_message(self, chat_id, text):
+        if chat_id == 3 and self.limited:
+            self.limited -= 1
+            raise RetryAfter(0)
+        self.sent.append((chat_id, text))
+
+
+def test_telegram_dispatcher(monkeypatch):
+    bot = FakeBot()
+    monkeypatch.setattr(ConfigManager, 'get', staticmethod(lambda key: '123456:ABC'))
+    monkeypatch.setattr(TelegramDispatcher, 'CHAT_RATE', 100)
+
+    dispatcher = TelegramDispatcher()
+    assert dispatcher.bot is dispatcher.bot
+
+    dispatcher._bot = bot
+    results = dispatcher.send_many([(1, 'a'), (1, 'b'), (2, 'c'), (3, 'd')])
+
+    assert results == {1: [True, True], 2: [True], 3: [True]}
+    assert bot.sent == [(1, 'a'), (2, 'c'), (3, 'd'), (1, 'b')]
+
+
+def test_digest(monkeypatch):
+    sent = []
+    monkeypatch.setattr(IftttLauncher, 'send', lambda self, *args: sent.append((self.url, *args)))
+    monkeypatch.setattr(NotifyRunLauncher, 'send',
+                        lambda self, *args: sent.append((self.config, *args)))
+    monkeypatch.setattr(BaseLauncher, 'DIGEST_WINDOW', 0.1)
+
+    IftttLauncher('url').fire('Backup', 'done')
+    IftttLauncher('url').fire('Ngrok', 'started')
+    NotifyRunLauncher('config').fire('Reboot', '1')
+    NotifyRunLauncher('config').fire('Reboot', '2')
+    assert sent == []
+
+    time.sleep(0.3)
+    assert sorted(sent) == [('config', 'Reboot', '1 | 2'),
+                            ('url', '2 notificaciones', 'Backup: done\n\nNgrok: started')]
+
+    IftttLauncher('url').fire('Backup', 'done')
+    BaseLauncher.flush_digests()
+    assert sent[-1] == ('url', 'Backup', 'done')
+
+
+def test_digest_bypass(monkeypatch):
+    sent = []
+    monkeypatch.setattr(IftttLauncher, 'send', lambda self, *args: sent.append(args))
+    monkeypatch.setattr(IftttLauncher, 'DIGEST_WINDOW', 60)
+
+    IftttLauncher('url').fire('Backup', 'done', digest=False)
+    assert sent == [('Backup', 'done')]
+
+    IftttLauncher('url').fire('Backup', 'queued')
+    assert BaseLauncher._flush_registered is True
+    assert len(sent) == 1
+
+    BaseLauncher.flush_digests()
+    assert sent[-1] == ('Backup', 'queued')
+
+
 if __name__ == '__main__':
     pytest.main([os.path.basename(__file__), '-v'])
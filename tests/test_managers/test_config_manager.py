@@ -27,6 +27,27 @@ class TestConfigManager:
     def test_save(self, codename):
         ConfigManager.get(codename)
 
+    def test_snapshot(self, codename):
+        snapshot = ConfigManager.snapshot()
+        assert snapshot is ConfigManager.snapshot()
+        assert snapshot[codename] == 'True'
+
+        ConfigManager.invalidate()
+        assert ConfigManager.snapshot() is not snapshot
+        assert ConfigManager.snapshot() == snapshot
+
+    def test_set_many_and_transaction(self, codename):
+        ConfigManager.set_many({codename + '-1': '1', codename + '-2': '2'})
+        assert ConfigManager.get(codename + '-1') == '1'
+        assert ConfigManager.get(codename + '-2') == '2'
+
+        with ConfigManager.transaction(force=True) as config_manager:
+            del config_manager[codename + '-1']
+            del config_manager[codename + '-2']
+
+        assert codename + '-1' not in ConfigManager.list()
+        assert codename + '-2' not in ConfigManager.list()
+
     def test_delete(self, codename):
         random_word = ''.join(
             random.choice(string.ascii_uppercase + string.digits) for _ in range(15))
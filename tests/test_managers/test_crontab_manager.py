@@ -1,8 +1,9 @@
 import os
 
 import pytest
+from crontab import CronItem
 
-from rpi.exceptions import ExistingJobError, CrontabError
+from rpi.exceptions import ExistingJobError, CrontabError, JobNotFoundError
 from rpi.managers.crontab_manager import CrontabManager
 from rpi.managers.services_manager import ServicesManager
 
@@ -25,6 +26,10 @@ class TestCrontabManager:
     def test_list_by_user_2(self):
         assert len(CrontabManager.list_by_user('test')) == 3
 
+    def test_group_by_user(self):
+        groups = CrontabManager.group_by_user()
+        assert groups['test'] == CrontabManager.list_by_user('test')
+
     def test_job_to_str(self):
         j1, j2, j3 = list(CrontabManager.list_by_user('test'))
 
@@ -38,6 +43,32 @@ class TestCrontabManager:
         assert service == ServicesManager.UNKNOWN.value
         assert options == ''
 
+    def test_job_to_str_options(self):
+        job = CronItem(
+            command='/home/pi/scripts/venv/bin/python /home/pi/scripts/aemet.py -today '
+                    '-invalid -tomorrow -notify test', comment='test')
+
+        service, options, username = CrontabManager.job_to_str(job, admin=True)
+        assert service == ServicesManager.AEMET.value
+        assert options == 'hoy mañana'
+        assert username == 'test'
+
+    def test_job_to_hash(self):
+        job1 = CronItem(command='/home/test/command', comment='test')
+        job1.hour.on(22)
+        job1.minutes.on(22)
+
+        job2 = CronItem(command='/home/test/command ', comment='test')
+        job2.hour.on(22)
+        job2.minutes.on(22)
+
+        # Must be the same in every process.
+        assert CrontabManager.job_to_hash(job1) == 5741556816664090065
+        assert CrontabManager.job_to_hash(job1) == CrontabManager.job_to_hash(job2)
+
+        job2.comment = 'other'
+        assert CrontabManager.job_to_hash(job1) != CrontabManager.job_to_hash(job2)
+
     def test_delete_by_anything(self):
         j1, j2, j3 = [job for job in CrontabManager.list_by_user('test')]
         j1 = CrontabManager.job_to_hash(j1)
@@ -47,6 +78,42 @@ class TestCrontabManager:
         CrontabManager.delete_by_anything(j2)
         CrontabManager.delete_by_anything(j3)
 
+    def test_session(self):
+        with CrontabManager() as crontab_manager:
+            job1 = crontab_manager.add('/home/test/command', 'test', 22, 22)
+            job2 = crontab_manager.add('/home/test/command2', 'test', 22, 22)
+
+            with pytest.raises(ExistingJobError, match='Job already exists'):
+                crontab_manager.add('/home/test/command', 'test', 22, 22)
+
+            assert crontab_manager.jobs_by_user('test') == (job1, job2)
+
+        assert len(CrontabManager.list_by_user('test')) == 2
+
+        with CrontabManager() as crontab_manager:
+            for job in crontab_manager.jobs_by_user('test'):
+                crontab_manager.remove(job)
+
+            with pytest.raises(JobNotFoundError, match='Can not find job'):
+                crontab_manager.remove(job1)
+
+        assert len(CrontabManager.list_by_user('test')) == 0
+
+    def test_apply(self):
+        plan = {'test': [('/home/test/command', 22, 22), ('/home/test/command2', 22, 22)]}
+        result = CrontabManager.apply(plan)
+        assert [len(x) for x in result['test']] == [2, 0]
+
+        plan = {'test': [('/home/test/command2', 22, 22), ('/home/test/command3', 21, 21)]}
+        result = CrontabManager.apply(plan)
+        assert [len(x) for x in result['test']] == [1, 1]
+        assert {job.command for job in CrontabManager.list_by_user('test')} == {
+            '/home/test/command2', '/home/test/command3'}
+
+        result = CrontabManager.apply({'test': []})
+        assert [len(x) for x in result['test']] == [0, 2]
+        assert len(CrontabManager.list_by_user('test')) == 0
+
 
 if __name__ == '__main__':
     pytest.main([os.path.basename(__file__), '-vs'])
@@ -0,0 +1,78 @@
+import os
+import timeit
+
+import pytest
+from cryptography.fernet import Fernet
+
+from rpi.exceptions import MissingKeyError
+from rpi.managers import encrypted_keys_manager
+from rpi.managers.encrypted_keys_manager import EncryptedKeysManager
+
+
+class CountingFernet(Fernet):
+    decryptions = 0
+
+    def decrypt(self, token, ttl=None):
+        CountingFernet.decryptions += 1
+        return super().decrypt(token, ttl)
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    monkeypatch.setattr(EncryptedKeysManager, 'PATH', str(tmp_path / 'keys.sqlite'))
+    monkeypatch.setattr(EncryptedKeysManager, 'KEY', Fernet.generate_key().decode())
+    monkeypatch.setattr(encrypted_keys_manager, 'get_fernet',
+                        lambda key: CountingFernet(key.encode()))
+    CountingFernet.decryptions = 0
+    EncryptedKeysManager.invalidate()
+
+
+class TestEncryptedKeysManager:
+    def test_set_and_get(self):
+        EncryptedKeysManager.set_many({'test_service': 'test_password', 'other': 'other_pass'})
+
+        assert EncryptedKeysManager.get('test_service') == 'test_password'
+        assert EncryptedKeysManager.get_many('other', 'test_service') == (
+            'other_pass', 'test_password')
+        assert set(EncryptedKeysManager.keys()) == {'test_service', 'other'}
+
+        with pytest.raises(MissingKeyError, match='random_service'):
+            EncryptedKeysManager.get('random_service')
+
+    def test_encrypted_at_rest(self):
+        EncryptedKeysManager.set('test_service', 'test_password')
+
+        with open(EncryptedKeysManager.PATH, 'rb') as file_handler:
+            assert b'test_password' not in file_handler.read()
+
+    def test_delete(self):
+        EncryptedKeysManager.set('test_service', 'test_password')
+        EncryptedKeysManager.delete('test_service')
+
+        with pytest.raises(MissingKeyError, match='test_service'):
+            EncryptedKeysManager.get('test_service')
+
+        with pytest.raises(MissingKeyError, match='test_service'):
+            EncryptedKeysManager.delete('test_service')
+
+    def test_decrypts_once(self):
+        EncryptedKeysManager.set_many({f'service_{i}': f'password_{i}' for i in range(50)})
+        EncryptedKeysManager.invalidate()
+        EncryptedKeysManager._decrypted = {}
+
+        EncryptedKeysManager.get('service_0')
+        assert CountingFernet.decryptions == 50
+
+        warm = min(timeit.repeat(lambda: EncryptedKeysManager.get('service_1'), number=1000))
+        assert CountingFernet.decryptions == 50
+
+        EncryptedKeysManager.set('service_50', 'password_50')
+        assert EncryptedKeysManager.get('service_50') == 'password_50'
+        assert CountingFernet.decryptions == 50
+
+        # Warm lookups never decrypt: they only stat the database and read the cached dict.
+        assert warm / 1000 < 1e-3
+
+
+if __name__ == '__main__':
+    pytest.main([os.path.basename(__file__), '-v'])
@@ -21,6 +21,15 @@ class TestKeysManager:
         with pytest.raises(MissingKeyError, match=random_service):
             KeysManager.get(random_service)
 
+    def test_get_many(self):
+        KeysManager.set('test_service_2', 'test_password_2')
+        assert KeysManager.get_many('test_service', 'test_service_2') == (
+            'test_password', 'test_password_2')
+        KeysManager().delete('test_service_2')
+
+        with pytest.raises(MissingKeyError, match='test_service_2'):
+            KeysManager.get_many('test_service', 'test_service_2')
+
     def test_delete(self):
         km = KeysManager()
         km.delete('test_service')
@@ -2,7 +2,8 @@ import os
 
 import pytest
 
-from rpi.managers.services_manager import ServicesManager
+from rpi.exceptions import UnexpectedBehaviourWarning
+from rpi.managers.services_manager import ServicesManager, parse_services
 
 
 class TestRaspberryService:
@@ -21,6 +22,14 @@ class TestRaspberryService:
         assert len(ServicesManager.MENUS.value.option_namespace) > 0
         assert len(ServicesManager.VCS.value.option_namespace) > 0
 
+    def test_options_names_set(self):
+        aemet = ServicesManager.AEMET.value
+        assert aemet.options_names_set == frozenset(aemet.options_names)
+        assert aemet.options_names is aemet.options_names
+
+        with pytest.raises(TypeError):
+            aemet.option_namespace['today'] = 'ahora'
+
     def test_filenames_with_ext(self):
         assert len(ServicesManager.AEMET.value.filenames_with_ext) > 0
         assert len(ServicesManager.MENUS.value.filenames_with_ext) > 0
@@ -98,6 +107,16 @@ class TestServicesManager:
         assert l7 == ServicesManager.LOG.value
         assert l8 == ServicesManager.LOG.value
 
+    def test_get_unknown(self):
+        assert ServicesManager.get('/home/pi/scripts/unknown-script.py') == \
+            ServicesManager.UNKNOWN.value
+        assert ServicesManager.get('unknown-script.py') == ServicesManager.UNKNOWN.value
+
+    def test_get_matches_corresponds_with(self):
+        for service in ServicesManager:
+            for identifier in service.value.filenames_with_ext:
+                assert ServicesManager.get(identifier).corresponds_with(identifier)
+
     def test_eval(self):
         e1 = ServicesManager.eval('(MENUS, AEMET)')
         e2 = ServicesManager.eval('(AEMET, MENUS)')
@@ -113,6 +132,24 @@ class TestServicesManager:
         assert e5 == (ServicesManager.CONTROLLER.value, ServicesManager.VCS.value)
         assert e6 == (ServicesManager.VCS.value, ServicesManager.CONTROLLER.value)
 
+    def test_eval_odd_data(self):
+        assert ServicesManager.eval('') == ()
+        assert ServicesManager.eval('()') == ()
+        assert ServicesManager.eval(None) == ()
+        assert ServicesManager.eval('(LOG,)') == (ServicesManager.LOG.value,)
+        assert ServicesManager.eval('[VCS]') == (ServicesManager.VCS.value,)
+        assert ServicesManager.eval('(ServicesManager.AEMET, MENUS)') == (
+            ServicesManager.AEMET.value, ServicesManager.MENUS.value)
+
+        with pytest.warns(UnexpectedBehaviourWarning, match='INVALID'):
+            assert ServicesManager.eval('(INVALID, AEMET)') == (ServicesManager.AEMET.value,)
+
+    def test_eval_cache(self):
+        parse_services.cache_clear()
+        ServicesManager.eval('(MENUS, AEMET)')
+        ServicesManager.eval('(MENUS, AEMET)')
+        assert parse_services.cache_info().hits == 1
+
 
 if __name__ == '__main__':
     pytest.main([os.path.basename(__file__), '-v'])
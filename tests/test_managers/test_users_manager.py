@@ -16,6 +16,14 @@ def random_string(n):
 
 @pytest.mark.xfail(condition='test' not in UsersManager(), reason="User 'test' not found.")
 class TestUser:
+    def test_lazy_cronitems(self):
+        users_manager = UsersManager()
+        assert all(user._cronitems is None for user in users_manager)
+
+        test = users_manager.by_username['test']
+        assert test.cronitems == CrontabManager.list_by_user('test')
+        assert all(user._cronitems is not None for user in users_manager)
+
     def test_update_cronitems(self):
         test = UsersManager.get_by_username('test')
 
@@ -31,6 +39,20 @@ class TestUser:
         test.update_cronitems()
         assert len(test.cronitems) == 0
 
+    def test_cronitems_reloaded_after_write(self):
+        test = UsersManager.get_by_username('test')
+        assert len(test.cronitems) == 0
+
+        CrontabManager.new('/home/test/command', 'test', 12, 12)
+
+        try:
+            assert len(test.cronitems) == 1
+        finally:
+            for job in CrontabManager.list_by_user('test'):
+                CrontabManager.delete_by_anything(job)
+
+        assert len(test.cronitems) == 0
+
 
 @pytest.mark.xfail(condition='test' not in UsersManager(), reason="User 'test' not found.")
 class TestUsersManager:
@@ -48,12 +70,27 @@ class TestUsersManager:
         with pytest.raises(UserNotFoundError, match=random_user):
             UsersManager.get_by_username(random_user)
 
-    def test_save_launcher(self):
+    def test_get_by_email(self):
         test = UsersManager.get_by_username('test')
-        test.launcher = TelegramLauncher(-1)
+        assert UsersManager.get_by_email(test.email) == test
+
+        random_email = random_string(20) + '@example.com'
+
+        with pytest.raises(UserNotFoundError, match=random_email):
+            UsersManager.get_by_email(random_email)
+
+    def test_shared(self):
+        assert UsersManager.shared() is UsersManager.shared()
+        assert UsersManager.get_by_username('test') is UsersManager.shared().by_username['test']
+
+    def test_save_launcher(self):
         um = UsersManager()
+        test = um.by_username['test']
+        test.launcher = TelegramLauncher(-1)
         um.save_launcher(test)
 
+        assert UsersManager.get_by_username('test') is not test
+
 
 if __name__ == '__main__':
     pytest.main([os.path.basename(__file__), '-v'])
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from rpi.exceptions import DownloaderError
+from rpi.notification_queue import NotificationQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = NotificationQueue(str(tmp_path / 'notifications.sqlite'))
+    queue.LEASE = 0
+    queue.BACKOFF = 0
+    queue.MAX_ATTEMPTS = 2
+    return queue
+
+
+def test_enqueue(queue):
+    assert queue.enqueue(['a', 'b'], 'title1', 'message1') == [1, 2]
+    assert queue.enqueue(['a'], 'title2', 'message2') == [3]
+    assert len(queue) == 3
+
+
+def test_claim_order(queue):
+    queue.enqueue(['a', 'b'], 'title1', 'message1')
+    queue.enqueue(['a'], 'title2', 'message2')
+
+    assert [x.id for x in queue.claim()] == [1, 2]
+    queue.ack(1)
+    assert [x.id for x in queue.claim()] == [2, 3]
+    assert [x.id for x in queue.claim(batch_size=1)] == [2]
+
+
+def test_lease(queue):
+    queue.LEASE = 300
+    queue.enqueue(['a'], 'title', 'message')
+
+    assert len(queue.claim()) == 1
+    assert queue.claim() == []
+
+
+def test_retry_and_dead_letters(queue):
+    queue.enqueue(['a'], 'title1', 'message1')
+    queue.enqueue(['a'], 'title2', 'message2')
+    error = DownloaderError('max retries failed.')
+
+    notification = queue.claim()[0]
+    assert queue.retry(notification, error) is True
+
+    notification = queue.claim()[0]
+    assert notification.attempts == 1
+    assert queue.retry(notification, error) is False
+
+    assert [x.id for x in queue.dead_letters()] == [1]
+    assert queue.dead_letters()[0].last_error == 'DownloaderError: max retries failed.'
+    assert [x.title for x in queue.claim()] == ['title2']
+
+    assert queue.requeue_dead_letters() == 1
+    assert queue.dead_letters() == []
+    assert len(queue) == 2
+
+
+def test_digest(queue):
+    assert queue.enqueue(['a', 'b'], 'title1', 'message1', digest=0.1) == [1, 2]
+    assert queue.enqueue(['a'], 'title2', 'message2', digest=0.1) == [1]
+    assert queue.enqueue(['b'], 'title3', 'message3') == [3]
+    assert queue.enqueue(['b'], 'title4', 'message4', digest=0.1) == [4]
+    assert queue.claim() == []
+
+    time.sleep(0.15)
+    notifications = queue.claim()
+    assert [x.id for x in notifications] == [1, 2]
+    assert notifications[0].messages == [('title1', 'message1'), ('title2', 'message2')]
+    assert notifications[1].messages == [('title1', 'message1')]
+
+    assert queue.enqueue(['a'], 'title5', 'message5', digest=0.1) == [5]
+
+
+def test_migrate_digest_columns(tmp_path):
+    path = str(tmp_path / 'notifications.sqlite')
+    con = sqlite3.connect(path)
+    con.execute('CREATE TABLE notifications (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'username VARCHAR NOT NULL, title VARCHAR NOT NULL, message VARCHAR NOT NULL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL, '
+                'dead INTEGER NOT NULL DEFAULT 0, last_error VARCHAR)')
+    con.commit()
+    con.close()
+
+    queue = NotificationQueue(path)
+    queue.enqueue(['a'], 'title1', 'message1', digest=60)
+    assert queue.enqueue(['a'], 'title2', 'message2', digest=60) == [1]
+
+
+if __name__ == '__main__':
+    pytest.main([os.path.basename(__file__), '-v'])
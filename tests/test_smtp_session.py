@@ -0,0 +1,103 @@
+import os
+import socketserver
+import threading
+from email.mime.text import MIMEText
+
+import pytest
+
+from rpi.smtp_session import SmtpSession
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP server, without TLS nor authentication."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost')
+
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+
+            if command == 'EHLO':
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                self.reply('354 go on')
+                data = []
+                while True:
+                    line = self.rfile.readline().decode()
+                    if line.rstrip('\r\n') == '.':
+                        break
+                    data.append(line)
+                self.server.messages.append(''.join(data))
+                self.reply('250 ok')
+
+                # Closes the connection as a server would do with an idle connection.
+                if self.server.drop_next:
+                    self.server.drop_next = False
+                    return
+            else:
+                self.reply('250 ok')
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('localhost', 0), SmtpHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.messages = []
+    server.drop_next = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_session(server, **kwargs):
+    return SmtpSession('rpi@localhost', None, 'localhost', server.server_address[1],
+                       starttls=False, **kwargs)
+
+
+def get_message(number):
+    msg = MIMEText(f'message {number}')
+    msg['To'] = 'user@localhost'
+    return msg
+
+
+def test_send_many(smtp_server):
+    with get_session(smtp_server) as session:
+        assert session.send_many(get_message(x) for x in range(5)) == [True] * 5
+
+    assert smtp_server.connections == 1
+    assert len(smtp_server.messages) == 5
+    assert 'message 4' in smtp_server.messages[-1]
+
+
+def test_idle_timeout(smtp_server):
+    with get_session(smtp_server, idle_timeout=0.01) as session:
+        session.send(get_message(1))
+        session.last_used -= 1
+        session.send(get_message(2))
+
+    assert smtp_server.connections == 2
+
+
+def test_reconnect(smtp_server):
+    with get_session(smtp_server) as session:
+        smtp_server.drop_next = True
+        session.send(get_message(1))
+        session.send(get_message(2))
+
+    assert smtp_server.connections == 2
+    assert len(smtp_server.messages) == 2
+
+
+if __name__ == '__main__':
+    pytest.main([os.path.basename(__file__), '-v'])